@@ -0,0 +1,54 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+# mkstemp creates files readable by the owner only, the files written here
+# get the usual permissions instead (other users read the metrics files)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def fsync_dir(dir_path):
+    """
+    fsync a folder, so a rename inside it survives a crash.
+    """
+    fd = os.open(dir_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+@contextmanager
+def atomic_open(path, mode='w'):
+    """
+    Open a temporary file next to path for writing, and when the block
+    finishes fsync it and rename it over path. Readers (and the next run
+    after a crash) see either the old file or the new one, never a
+    truncated one. If the block raises, the temporary file is removed and
+    path is left alone. Every writer gets a temporary file of its own, so
+    two processes writing the same path never write into each other's.
+    """
+    path = os.fspath(path)
+    dir_path, name = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{name}.", suffix='.tmp', dir=dir_path or '.')
+    try:
+        if hasattr(os, 'fchmod'):
+            os.fchmod(fd, 0o666 & ~_UMASK)
+        with os.fdopen(fd, mode) as f:
+            fd = None
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if fd is not None:
+            os.close(fd)
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    fsync_dir(dir_path or '.')
+
+def write_atomic(path, text):
+    with atomic_open(path) as f:
+        f.write(text)
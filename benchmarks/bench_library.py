@@ -0,0 +1,254 @@
+"""
+Benchmark full movie and show runs on synthetic libraries.
+
+A downloads/ tree with realistic release names, season folders,
+Featurettes folders, subtitles and a few in-progress .parts files is
+generated on tmpfs (/dev/shm) for every size, then hardlink_movies.py and
+hardlink_shows.py are run against it, each in a fresh process. For every
+run it reports the time spent in the discover, parse, link and track
+phases and in total, files/s, the peak RSS of the run and the number of
+filesystem calls made, by type.
+
+The calls are counted by wrapping the os functions the code goes through
+(stat, scandir, link, mkdir, open, fsync, ...), so they count calls made
+from Python, not every syscall the interpreter makes.
+
+Save the results of a run with --save and compare a later run against
+them with --compare, which exits with 1 if a run got slower than
+--tolerance or makes more calls than before.
+
+Usage: python benchmarks/bench_library.py [--sizes 1000,10000,100000,1000000]
+                                          [--kinds movies,shows] [--save FILE] [--compare FILE]
+"""
+import io
+import os
+import sys
+import json
+import random
+import shutil
+import argparse
+import builtins
+import resource
+import tempfile
+import time
+import contextlib
+import subprocess
+from pathlib import Path
+from collections import Counter
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+PHASES = ('discover', 'parse', 'link', 'track')
+COUNTED_CALLS = ('stat', 'lstat', 'scandir', 'listdir', 'mkdir', 'link', 'unlink', 'replace', 'fsync')
+
+TITLE_WORDS = ["Breaking", "Bad", "Mr", "Robot", "Parks", "and", "Recreation", "Family", "Guy", "Game", "of",
+               "Thrones", "Chernobyl", "The", "Last", "Night", "Blue", "River", "House", "Dark", "City",
+               "Station", "Eleven", "Better", "Call", "Saul", "Wire", "True", "Detective", "Office"]
+EPISODE_WORDS = ["Pilot", "Hello", "Friend", "Cat's", "in", "the", "Bag", "Gray", "Matter", "Crazy",
+                 "Handful", "Nothin'", "A", "No-Rough-Stuff", "Type", "Deal", "Make", "My", "Pit", "Park"]
+QUALITIES = ["1080p BluRay x265 Silence", "720p WEB-DL x264 NTb", "2160p AMZN WEBRip x265 HDR",
+             "1080p AMZN WEBRip x265 Silence", "480p DVDRip x264"]
+SCENE_TAGS = ["1080p.10bit.BluRay.AAC5.1.HEVC-Vyndros", "720p.HDTV.x264-KILLERS", "2160p.WEB.H265-GGEZ"]
+EXTRAS = ["Behind the Scenes", "Deleted Scenes", "Gag Reel", "Inside the Episode", "Interview - Cast"]
+
+def title(rng, words=(1, 4)):
+    return " ".join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(*words)))
+
+class TreeWriter:
+    """
+    Creates empty files until the requested number is reached.
+    """
+
+    def __init__(self, root, limit):
+        self.root = root
+        self.limit = limit
+        self.count = 0
+
+    @property
+    def full(self):
+        return self.count >= self.limit
+
+    def touch(self, *parts):
+        if self.full:
+            return
+        path = os.path.join(self.root, *parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o644))
+        self.count += 1
+
+def make_shows(root, files, seed=1):
+    """
+    Show folders with season folders, episodes in two naming styles,
+    some subtitles, Featurettes folders and in-progress downloads.
+    """
+    rng = random.Random(seed)
+    tree = TreeWriter(root, files)
+    show = 0
+    while not tree.full:
+        show += 1
+        name = f"{title(rng)} {show}"
+        year = rng.randint(1990, 2024)
+        scene = rng.random() < 0.3
+        show_dir = f"{name.replace(' ', '.')}.S01-S08.{rng.choice(SCENE_TAGS)}" if scene else f"{name} ({year})"
+        for season in range(1, rng.randint(1, 8) + 1):
+            season_dir = os.path.join(show_dir, f"Season {season}")
+            for episode in range(1, rng.randint(6, 24) + 1):
+                if scene:
+                    base = f"{name.replace(' ', '.')}.S{season:02d}E{episode:02d}.{rng.choice(SCENE_TAGS)}"
+                else:
+                    episode_name = " ".join(rng.choice(EPISODE_WORDS) for _ in range(rng.randint(1, 4)))
+                    base = f"{name} ({year}) - S{season:02d}E{episode:02d} - {episode_name} ({rng.choice(QUALITIES)})"
+                tree.touch(season_dir, base + ".mkv")
+                if rng.random() < 0.1:
+                    tree.touch(season_dir, base + ".srt")
+            if rng.random() < 0.2:
+                for extra in rng.sample(EXTRAS, rng.randint(1, 3)):
+                    tree.touch(season_dir, "Featurettes", f"{extra} - {title(rng, (1, 2))}.mkv")
+            if rng.random() < 0.02:
+                tree.touch(season_dir, f".{rng.getrandbits(64):016x}.parts")
+    return tree.count
+
+def make_movies(root, files, seed=1):
+    """
+    One folder per movie, with subtitles and Featurettes for some of them.
+    """
+    rng = random.Random(seed)
+    tree = TreeWriter(root, files)
+    movie = 0
+    while not tree.full:
+        movie += 1
+        name = f"{title(rng)} {movie} ({rng.randint(1950, 2024)})"
+        tree.touch(name, f"{name} ({rng.choice(QUALITIES)}).mkv")
+        if rng.random() < 0.3:
+            tree.touch(name, f"{name}.srt")
+        if rng.random() < 0.1:
+            for extra in rng.sample(EXTRAS, rng.randint(1, 3)):
+                tree.touch(name, "Featurettes", f"{extra}.mkv")
+    return tree.count
+
+GENERATORS = {'movies': make_movies, 'shows': make_shows}
+
+def install_counters(calls):
+    """
+    Wrap the os functions (and open) the run goes through to count them.
+    """
+    def counting(name, func):
+        def wrapper(*args, **kwargs):
+            calls[name] += 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    for name in COUNTED_CALLS:
+        setattr(os, name, counting(name, getattr(os, name)))
+    builtins.open = counting('open', builtins.open)
+
+def run_child(kind, root):
+    """
+    One run in this (fresh) process. Prints the results as JSON.
+    """
+    from hardlink_shows import process_tv_shows
+    from hardlink_movies import process_movies
+
+    state = Path(root) / "hardlinks"
+    state.mkdir(exist_ok=True)
+    metrics_file = state / f"metrics_{kind}.json"
+    source, target = Path(root) / "downloads" / kind, Path(root) / "media" / kind
+    tracking_file = state / f"hardlinked_{kind}.json"
+
+    calls = Counter()
+    install_counters(calls)
+    start = time.perf_counter()
+    # The runs print a line per unmatched name, keep that out of the timings
+    with contextlib.redirect_stdout(io.StringIO()):
+        if kind == 'shows':
+            process_tv_shows(source, target, tracking_file, metrics_json=metrics_file)
+        else:
+            process_movies(source, target, tracking_file, metrics_json=metrics_file)
+    # Includes what no phase covers, like compacting the tracking file on close
+    wall = time.perf_counter() - start
+    counted = dict(calls)
+
+    with open(metrics_file, 'r') as f:
+        metrics = json.load(f)
+    print(json.dumps({
+        'phases': {phase: metrics['phases'][phase]['seconds'] for phase in PHASES},
+        'links': metrics['phases']['link'].get('links', 0),
+        'seconds': round(wall, 3),
+        'calls': counted,
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+def run_one(kind, size, base):
+    root = tempfile.mkdtemp(prefix=f"bench_{kind}_{size}_", dir=base)
+    try:
+        files = GENERATORS[kind](os.path.join(root, "downloads", kind), size)
+        output = subprocess.run([sys.executable, __file__, "--child", kind, root],
+                                check=True, capture_output=True, text=True).stdout
+        result = json.loads(output)
+    finally:
+        shutil.rmtree(root)
+
+    seconds = result['seconds']
+    result.update(kind=kind, size=size, files=files,
+                  files_per_second=round(files / seconds) if seconds > 0 else None)
+    return result
+
+def print_result(result):
+    phases = " ".join(f"{phase}={result['phases'][phase]:.3f}s" for phase in PHASES)
+    calls = " ".join(f"{name}={count}" for name, count in sorted(result['calls'].items()))
+    print(f"{result['kind']:6} {result['files']:8} files  {phases}  total={result['seconds']:.3f}s  "
+          f"{result['files_per_second'] or 0:8} files/s  rss={result['peak_rss_mb']}MB")
+    print(f"{'':6} {'':8}        calls: {calls}")
+
+def compare(results, baseline_file, tolerance):
+    """
+    Print how every run did against a saved baseline. Returns True if
+    none of them regressed.
+    """
+    with open(baseline_file, 'r') as f:
+        baseline = {(r['kind'], r['size']): r for r in json.load(f)}
+
+    ok = True
+    print("\nAgainst", baseline_file)
+    for result in results:
+        old = baseline.get((result['kind'], result['size']))
+        if old is None or not old['files_per_second'] or not result['files_per_second']:
+            continue
+        change = result['files_per_second'] / old['files_per_second'] - 1
+        more_calls = sum(result['calls'].values()) - sum(old['calls'].values())
+        regressed = change < -tolerance or more_calls > 0
+        ok = ok and not regressed
+        print(f"{result['kind']:6} {result['size']:8}  files/s {change:+.1%}  calls {more_calls:+d}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000",
+                        help="comma separated library sizes in files")
+    parser.add_argument("--kinds", default="movies,shows")
+    parser.add_argument("--save", metavar="FILE", help="write the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="slowdown in files/s allowed by --compare (default: 0.2)")
+    parser.add_argument("--child", nargs=2, metavar=("KIND", "ROOT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        sys.exit(0)
+
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    results = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        for kind in args.kinds.split(','):
+            result = run_one(kind, size, base)
+            print_result(result)
+            results.append(result)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        sys.exit(1)
@@ -0,0 +1,129 @@
+"""
+Regression corpus runner for the naming rules.
+
+Every [filename, kind, new name] entry of the corpus (naming_corpus.json
+next to this file by default) is classified with the rules and has to come
+out the same, anything else is printed as a mismatch and makes the run
+exit with 1. Then the corpus is scaled up and timed, next to the legacy
+sequential regexes. The rules have to be at least --min-speedup times as
+fast as the legacy regexes (default 1.0, never slower), or the run exits
+with 1 as well.
+
+With --extra-rules N, N made up rules that only apply to other prefixes and
+extensions are added in front of the real ones and the timing is repeated,
+to check that more rules do not make every name slower. They are held to
+the same --min-speedup.
+
+Usage: python benchmarks/bench_naming.py [--rules FILE] [--corpus FILE] [--names 100000] [--extra-rules 50]
+                                         [--min-speedup 1.0]
+"""
+import gc
+import re
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from naming_rules import DEFAULT_RULES_FILE, NameMatcher
+from bench_classifier import legacy_sanitize
+
+CORPUS_FILE = Path(__file__).resolve().parent / "naming_corpus.json"
+
+def load(rules_file):
+    with open(rules_file, 'r') as f:
+        return json.load(f)
+
+def extra_rules(count):
+    """
+    Rules for names nobody downloads, half gated on a prefix and half on an
+    extension, like the site or group specific rules people add.
+    """
+    rules = []
+    for i in range(count):
+        rule = {"name": f"extra_{i}", "kind": "extra", "pattern": r"^(?P<title>.*?)(?P<extension>\.[^.]+)$",
+                "format": ["{title}", "{extension}"]}
+        if i % 2:
+            rule["prefix"] = f"~site{i}~"
+        else:
+            rule["extensions"] = [f".x{i}"]
+        rules.append(rule)
+    return rules
+
+def check(matcher, corpus):
+    mismatches = []
+    for name, kind, new_name in corpus:
+        parsed = matcher.classify(name)
+        if (parsed.kind, parsed.name) != (kind, new_name):
+            mismatches.append((name, (kind, new_name), (parsed.kind, parsed.name)))
+    return mismatches
+
+def scale(corpus, size):
+    """
+    Repeat the corpus names with varying numbers, so nothing is cached.
+    """
+    names = []
+    i = 0
+    while len(names) < size:
+        for name, _, _ in corpus:
+            names.append(re.sub(r'\d+', lambda match: str(int(match.group()) + i % 7), name, count=1))
+        i += 1
+    return names[:size]
+
+def timed(funcs, names, repeat=5):
+    """
+    Best time of each function over all names. The functions take turns,
+    so a busy machine slows them down alike and the ratios hold. The
+    garbage collector is off while timing, like timeit.
+    """
+    best = [None] * len(funcs)
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            for i, func in enumerate(funcs):
+                start = time.perf_counter()
+                for name in names:
+                    func(name)
+                elapsed = time.perf_counter() - start
+                best[i] = elapsed if best[i] is None else min(best[i], elapsed)
+    finally:
+        gc.enable()
+    return best
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rules", default=DEFAULT_RULES_FILE, help="rules file (default: naming_rules.json)")
+    parser.add_argument("--corpus", default=CORPUS_FILE, help="corpus file (default: naming_corpus.json)")
+    parser.add_argument("--names", type=int, default=100000, help="names to time (default: 100000)")
+    parser.add_argument("--extra-rules", type=int, default=0, metavar="N", help="also time with N unrelated rules added")
+    parser.add_argument("--min-speedup", type=float, default=1.0,
+                        help="fail when the rules are slower than this times legacy (default: 1.0)")
+    args = parser.parse_args()
+
+    config = load(args.rules)
+    corpus = load(args.corpus)
+    matchers = {"rules": NameMatcher(config['rules'], config.get('keep_names_in', ()))}
+    if args.extra_rules:
+        matchers[f"+{args.extra_rules} rules"] = NameMatcher(extra_rules(args.extra_rules) + config['rules'])
+
+    failed = False
+    for label, matcher in matchers.items():
+        mismatches = check(matcher, corpus)
+        for name, expected, got in mismatches:
+            print(f"MISMATCH ({label}) {name!r}: expected {expected!r}, got {got!r}")
+        failed = failed or bool(mismatches)
+    print(f"corpus:     {len(corpus)} names, {'FAILED' if failed else 'ok'}")
+
+    names = scale(corpus, args.names)
+    legacy_time, *times = timed([legacy_sanitize] + [matcher.classify for matcher in matchers.values()], names)
+    print(f"names:      {len(names)}")
+    print(f"legacy:     {legacy_time:.3f}s ({len(names) / legacy_time:,.0f} names/s)")
+    for label, elapsed in zip(matchers, times):
+        speedup = legacy_time / elapsed
+        slow = speedup < args.min_speedup
+        print(f"{label + ':':11} {elapsed:.3f}s ({len(names) / elapsed:,.0f} names/s), {speedup:.2f}x legacy"
+              f"{f', SLOWER than {args.min_speedup:g}x' if slow else ''}")
+        failed = failed or slow
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,79 @@
+"""
+Benchmark what a download client hook pays per finished torrent.
+
+A synthetic show library (see bench_library.py) is generated and linked
+once. Then, for every repetition, a new episode is added to it and linked
+again, each time in a fresh process:
+
+- python -c pass: the interpreter startup alone
+- hardlink_cli.py --help: startup plus the CLI imports
+- hardlink_cli.py link-one: link just the new episode
+- hardlink_shows.py --incremental: the full run a hook used to make
+
+The median and best wall time of each are printed in milliseconds. With
+--budget, exits with 1 if link-one is slower than that.
+
+Usage: python benchmarks/bench_startup.py [--size 10000] [--repeat 10] [--budget MS]
+"""
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import time
+import statistics
+import subprocess
+
+from bench_library import ROOT, make_shows
+
+def timed_run(args, cwd):
+    start = time.perf_counter()
+    subprocess.run(args, cwd=cwd, check=True, stdout=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+def new_episode(root, n):
+    """
+    Add an episode, as a download client would when a torrent finishes.
+    """
+    folder = os.path.join(root, "downloads", "shows", f"Bench Show ({2000 + n % 20})", "Season 1")
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"Bench Show ({2000 + n % 20}) - S01E{n:02d} - Episode (1080p BluRay x265 Silence).mkv")
+    os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o644))
+    return path
+
+def bench(size, repeat, base):
+    root = tempfile.mkdtemp(prefix=f"bench_startup_{size}_", dir=base)
+    cli = str(ROOT / "hardlink_cli.py")
+    shows = str(ROOT / "hardlink_shows.py")
+    try:
+        make_shows(os.path.join(root, "downloads", "shows"), size)
+        # Link everything once, so the runs below only have the new episode to do
+        subprocess.run([sys.executable, shows, "--incremental"], cwd=root, check=True, stdout=subprocess.DEVNULL)
+
+        timings = {name: [] for name in ("python -c pass", "cli --help", "link-one", "full --incremental")}
+        for n in range(1, repeat + 1):
+            timings["python -c pass"].append(timed_run([sys.executable, "-c", "pass"], root))
+            timings["cli --help"].append(timed_run([sys.executable, cli, "--help"], root))
+            timings["link-one"].append(timed_run([sys.executable, cli, "link-one", new_episode(root, 2 * n)], root))
+            new_episode(root, 2 * n + 1)
+            timings["full --incremental"].append(timed_run([sys.executable, shows, "--incremental"], root))
+    finally:
+        shutil.rmtree(root)
+    return timings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=10000, help="files in the library (default: 10000)")
+    parser.add_argument("--repeat", type=int, default=10, help="runs of each command (default: 10)")
+    parser.add_argument("--budget", type=float, metavar="MS", help="fail if link-one takes longer (median)")
+    args = parser.parse_args()
+
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    timings = bench(args.size, args.repeat, base)
+    print(f"Library of {args.size} files, {args.repeat} runs each")
+    for name, values in timings.items():
+        print(f"{name:20} median={statistics.median(values):8.1f}ms  best={min(values):8.1f}ms")
+
+    if args.budget is not None and statistics.median(timings["link-one"]) > args.budget:
+        print(f"link-one is over the {args.budget:.0f}ms budget")
+        sys.exit(1)
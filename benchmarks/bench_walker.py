@@ -0,0 +1,138 @@
+"""
+Count the filesystem syscalls made to walk a shows tree the old way
+(rglob counting pass + recursive iterdir/is_dir/is_file/exists pass) and
+with the shared scandir walker.
+
+Calls are counted by wrapping os.stat/os.lstat/os.listdir/os.scandir and
+DirEntry.stat(), which is what pathlib and the walker go through.
+
+Usage: python benchmarks/bench_walker.py [--shows 200] [--episodes 20]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from collections import Counter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from walker import scan_tree
+
+calls = Counter()
+
+class CountingDirEntry:
+    """
+    Wraps an os.DirEntry so the stat() calls that miss its cache are counted.
+    """
+
+    def __init__(self, entry):
+        self._entry = entry
+        self._stat_cached = {}
+
+    def stat(self, follow_symlinks=True):
+        if follow_symlinks not in self._stat_cached:
+            calls['stat'] += 1
+            self._stat_cached[follow_symlinks] = True
+        return self._entry.stat(follow_symlinks=follow_symlinks)
+
+    def __fspath__(self):
+        return self._entry.path
+
+    def __getattr__(self, name):
+        return getattr(self._entry, name)
+
+class CountingScandir:
+    def __init__(self, it):
+        self._it = it
+
+    def __iter__(self):
+        return (CountingDirEntry(entry) for entry in self._it)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._it.close()
+
+    def close(self):
+        self._it.close()
+
+def install_counters():
+    real_stat, real_lstat, real_listdir, real_scandir = os.stat, os.lstat, os.listdir, os.scandir
+
+    def stat(*args, **kwargs):
+        calls['stat'] += 1
+        return real_stat(*args, **kwargs)
+
+    def lstat(*args, **kwargs):
+        calls['stat'] += 1
+        return real_lstat(*args, **kwargs)
+
+    def listdir(*args, **kwargs):
+        calls['listdir'] += 1
+        return real_listdir(*args, **kwargs)
+
+    def scandir(*args, **kwargs):
+        calls['listdir'] += 1
+        return CountingScandir(real_scandir(*args, **kwargs))
+
+    os.stat, os.lstat, os.listdir, os.scandir = stat, lstat, listdir, scandir
+
+def make_tree(root, shows, episodes):
+    for show in range(shows):
+        season_dir = root / f"Show {show} (2010)" / "Season 1"
+        (season_dir / "Featurettes").mkdir(parents=True)
+        for episode in range(1, episodes + 1):
+            (season_dir / f"Show {show} (2010) - S01E{episode:02d} - Episode (1080p BluRay x265).mkv").touch()
+        (season_dir / "Featurettes" / "Behind the Scenes.mkv").touch()
+
+def old_walk(source_path):
+    """
+    What process_tv_shows did before: a counting pass, then a recursive
+    pass with is_dir/is_file on every item and exists on every target.
+    """
+    total_files = sum(1 for _ in source_path.rglob('*') if _.is_file())
+    seen = 0
+
+    def visit(path):
+        nonlocal seen
+        for item in path.iterdir():
+            if item.is_dir():
+                visit(item)
+            elif item.is_file():
+                item.exists()  # stands in for the new_file.exists() check
+                seen += 1
+
+    visit(source_path)
+    return total_files, seen
+
+def new_walk(source_path):
+    files = list(scan_tree(source_path))
+    return len(files), len(files)
+
+def run(name, func, source_path):
+    calls.clear()
+    start = time.perf_counter()
+    total, seen = func(source_path)
+    elapsed = time.perf_counter() - start
+    print(f"{name:8} files={seen:7} stat={calls['stat']:8} listdir={calls['listdir']:6} "
+          f"total={calls['stat'] + calls['listdir']:8} time={elapsed:.3f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--shows", type=int, default=200)
+    parser.add_argument("--episodes", type=int, default=20)
+    args = parser.parse_args()
+
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    tmp = Path(tempfile.mkdtemp(prefix="bench_walker_", dir=base))
+    try:
+        make_tree(tmp, args.shows, args.episodes)
+        install_counters()
+        run("pathlib", old_walk, tmp)
+        run("scandir", new_walk, tmp)
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,58 @@
+import os
+import json
+from pathlib import Path
+
+from atomic_file import atomic_open
+
+class Checkpoint:
+    """
+    Remember how far a run got through the source tree.
+
+    The walk goes through the source folders in a fixed order (see
+    scan_tree), one folder at a time. After a batch of folders is linked
+    and its tracking records are on disk, the last of those folders is
+    saved as the position. If the run dies, a --resume run starts the walk
+    after that folder without listing, checking or linking anything before
+    it again. The file is removed once a run finishes.
+
+    The checkpoint is tied to the source and target folders it was made
+    for, and is ignored for any other pair.
+    """
+
+    def __init__(self, checkpoint_file, source, target):
+        self.checkpoint_file = Path(checkpoint_file)
+        self.source = str(source)
+        self.target = str(target)
+        self.position = None
+        self.done = 0
+
+    def load(self):
+        """
+        Read the saved position. Returns True if there is one to resume from.
+        """
+        if not self.checkpoint_file.exists():
+            return False
+        with open(self.checkpoint_file, 'r') as f:
+            data = json.load(f)
+        if data.get('source') != self.source or data.get('target') != self.target:
+            return False
+        self.position = data['position']
+        self.done = data.get('done', 0)
+        return True
+
+    def save(self, relative_dir, done):
+        """
+        Record that every folder up to and including relative_dir is
+        committed, done items in total.
+        """
+        self.position = relative_dir.split(os.sep) if relative_dir else []
+        self.done = done
+        with atomic_open(self.checkpoint_file) as f:
+            json.dump({'source': self.source, 'target': self.target,
+                       'position': self.position, 'done': done}, f)
+
+    def clear(self):
+        self.position = None
+        self.done = 0
+        if self.checkpoint_file.exists():
+            self.checkpoint_file.unlink()
@@ -0,0 +1,257 @@
+import os
+import mmap
+import json
+import hashlib
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+from atomic_file import atomic_open
+from walker import scan_tree
+
+# Blocks hashed per file, and their size. A 50 GB remux costs 16 x 64 KiB
+# of reads, files up to 1 MiB are hashed whole.
+SAMPLES = 16
+BLOCK_SIZE = 64 * 1024
+
+def sample_offsets(size, samples=SAMPLES, block_size=BLOCK_SIZE):
+    """
+    Where the sampled blocks start: the first and the last block and the
+    rest spread evenly in between, or every block of a small file.
+    """
+    if size <= samples * block_size:
+        return range(0, size, block_size)
+    last = size - block_size
+    return [last * i // (samples - 1) for i in range(samples)]
+
+def fingerprint(path, samples=SAMPLES, block_size=BLOCK_SIZE):
+    """
+    Fingerprint a file by its size and a hash of sampled blocks, read
+    through mmap so only the sampled pages are faulted in. Two files with
+    the same fingerprint are taken to have the same content. Returns
+    "size:hash".
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                if hasattr(mmap, 'MADV_RANDOM'):
+                    # Do not read ahead around the samples
+                    m.madvise(mmap.MADV_RANDOM)
+                for offset in sample_offsets(size, samples, block_size):
+                    digest.update(m[offset:offset + block_size])
+    return f"{size}:{digest.hexdigest()}"
+
+class FingerprintCache:
+    """
+    Fingerprints of earlier runs, keyed by (st_dev, st_ino) and only used
+    while the file's size and mtime are unchanged, so a file is hashed
+    again once it is replaced or rewritten. A cache made with other sample
+    settings is thrown away on load.
+    """
+
+    def __init__(self, cache_file, samples=SAMPLES, block_size=BLOCK_SIZE):
+        self.cache_file = Path(cache_file)
+        self.settings = [samples, block_size]
+        # "dev:ino" -> [size, mtime_ns, fingerprint]
+        self.entries = {}
+        self.changed = False
+        if self.cache_file.exists():
+            try:
+                with open(self.cache_file, 'r') as f:
+                    data = json.load(f)
+            except ValueError:
+                # Unreadable cache, just start over
+                return
+            if data.get('settings') == self.settings:
+                self.entries = data['entries']
+
+    def get(self, st):
+        entry = self.entries.get(f"{st.st_dev}:{st.st_ino}")
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            return entry[2]
+        return None
+
+    def put(self, st, value):
+        self.entries[f"{st.st_dev}:{st.st_ino}"] = [st.st_size, st.st_mtime_ns, value]
+        self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        with atomic_open(self.cache_file) as f:
+            json.dump({'settings': self.settings, 'entries': self.entries}, f)
+        self.changed = False
+
+class Fingerprinter:
+    """
+    Fingerprint batches of files, from the cache when possible and on a
+    process pool otherwise, so hashing is not held up by the GIL and the
+    reads of several files are in flight at once. The pool is only started
+    once there is something to hash, and spawns its processes instead of
+    forking, as the libraries of a concurrent run are threads.
+    """
+
+    def __init__(self, cache=None, workers=None):
+        self.cache = cache
+        self.workers = workers
+        self.pool = None
+        self.hashed = 0
+
+    def fingerprints(self, paths):
+        """
+        Returns {path: fingerprint}. Files that cannot be read are left out.
+        """
+        results = {}
+        todo = []
+        for path in dict.fromkeys(paths):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            value = self.cache.get(st) if self.cache is not None else None
+            if value is not None:
+                results[path] = value
+            else:
+                todo.append((path, st))
+        if not todo:
+            return results
+
+        if len(todo) == 1:
+            # Not worth a round trip to the pool
+            values = [_try_fingerprint(todo[0][0])]
+        else:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            values = self.pool.map(_try_fingerprint, [path for path, _ in todo])
+        for (path, st), value in zip(todo, values):
+            if value is None:
+                continue
+            results[path] = value
+            self.hashed += 1
+            if self.cache is not None:
+                self.cache.put(st, value)
+        return results
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.cache is not None:
+            self.cache.save()
+
+def _try_fingerprint(path):
+    try:
+        return fingerprint(path)
+    except (OSError, ValueError):
+        return None
+
+class SizeIndex:
+    """
+    Media files by size and inode, from one scan of the target tree. Only
+    files of the same size can have the same content, so only those are
+    ever fingerprinted.
+    """
+
+    def __init__(self):
+        # size -> [path, ...]
+        self.sizes = {}
+        # path -> (dev, ino)
+        self.targets = {}
+
+    def scan(self, root):
+        if not os.path.isdir(root):
+            return self
+        for _, entry in scan_tree(root):
+            st = entry.stat(follow_symlinks=False)
+            self.add(entry.path, st)
+        return self
+
+    def add(self, path, st):
+        self.sizes.setdefault(st.st_size, []).append(path)
+        self.targets[path] = (st.st_dev, st.st_ino)
+
+def match_plan(plan, index, fingerprinter):
+    """
+    Compare the sources of a plan with the media files by content.
+
+    Returns (todo, duplicates, replacements):
+    - duplicates: items whose content is already in the media tree under
+      another file (not a link of the source, e.g. the same release
+      downloaded again), as (item, existing path). Linking them would only
+      add a second name for the same thing.
+    - replacements: items whose target path holds a different file with
+      different content (a new version of the download), as (item,
+      existing path). These are left alone, as a run always does with
+      existing targets.
+    - todo: everything else, still to be linked.
+
+    Only the sources with a media file of the same size and the media files
+    they could match are fingerprinted, all at once.
+    """
+    candidates = {}
+    for item in plan:
+        try:
+            st = os.stat(item.source)
+        except OSError:
+            continue
+        key = (st.st_dev, st.st_ino)
+        if index.targets.get(item.target) == key:
+            # Already linked there, a normal run skips it
+            continue
+        same_size = [path for path in index.sizes.get(st.st_size, ()) if index.targets[path] != key]
+        if same_size or item.target in index.targets:
+            candidates[item] = same_size
+
+    # Files of different sizes differ, those are never hashed
+    paths = [item.source for item, same_size in candidates.items() if same_size]
+    paths += [path for same_size in candidates.values() for path in same_size]
+    prints = fingerprinter.fingerprints(paths) if paths else {}
+
+    todo, duplicates, replacements = [], [], []
+    for item in plan:
+        same_size = candidates.get(item)
+        if same_size is None:
+            todo.append(item)
+            continue
+        source_print = prints.get(item.source)
+        existing = [path for path in same_size if source_print is not None and prints.get(path) == source_print]
+        if item.target in existing:
+            # A copy or reflink made by the link fallback, a normal run skips it
+            todo.append(item)
+        elif existing:
+            duplicates.append((item, existing[0]))
+        elif item.target in index.targets:
+            replacements.append((item, item.target))
+        else:
+            todo.append(item)
+    return todo, duplicates, replacements
+
+def find_matches(paths, index, fingerprinter):
+    """
+    The media files with the same content as each of paths, as {path:
+    [media paths]}. Hardlinks of a path are not counted as matches.
+    """
+    same_sizes = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        key = (st.st_dev, st.st_ino)
+        same_sizes[path] = [other for other in index.sizes.get(st.st_size, ()) if index.targets[other] != key]
+    prints = fingerprinter.fingerprints([path for path, same_size in same_sizes.items() if same_size] +
+                                        [other for same_size in same_sizes.values() for other in same_size])
+    return {path: [other for other in same_size if path in prints and prints.get(other) == prints[path]]
+            for path, same_size in same_sizes.items()}
+
+def print_match_summary(duplicate_count, replacement_count, hashed):
+    print(f"Same content already in media: {duplicate_count} | Replaced downloads: {replacement_count} | "
+          f"Files hashed: {hashed}")
+
+def print_match_details(duplicates, replacements):
+    for item, existing in duplicates:
+        print(f"Duplicate: {item.source} has the same content as {existing}")
+    for item, existing in replacements:
+        print(f"Replacement: {item.source} is a different file than {existing}")
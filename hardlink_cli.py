@@ -0,0 +1,133 @@
+import sys
+import argparse
+
+# Only argparse is imported up front. Each command imports what it needs
+# when it runs, so "link-one" from a download client hook does not pay for
+# the engine, the worker pool or the parse cache.
+
+def find_library(path, config_file=None):
+    """
+    The library a download belongs to, as (kind, source, target, tracking
+    file, layout, link function, naming rules file). Without a config file these are the
+    defaults of hardlink_shows.py / hardlink_movies.py under the current
+    folder.
+    """
+    import os
+
+    path = os.path.abspath(path)
+    if config_file is None:
+        current_dir = os.getcwd()
+        candidates = [(kind, os.path.join(current_dir, "downloads", kind), os.path.join(current_dir, "media", kind),
+                       os.path.join(current_dir, "hardlinks", f"hardlinked_{kind}.json"), "mirror", os.link, None)
+                      for kind in ("shows", "movies")]
+    else:
+        from hardlink_engine import load_config, create_hardlink
+        from link_methods import LinkChain
+        libraries, options = load_config(config_file)
+        link = create_hardlink
+        if tuple(options['link_methods']) != ('hardlink',):
+            link = LinkChain(options['link_methods'], options['copy_workers'], options['bandwidth'])
+        candidates = [(library.kind, str(library.source), str(library.target), library.tracking_file,
+                       library.layout, link, library.naming_rules) for library in libraries]
+
+    # The deepest source folder wins, for libraries nested in each other
+    for candidate in sorted(candidates, key=lambda candidate: len(candidate[1]), reverse=True):
+        if path == candidate[1] or path.startswith(os.path.join(candidate[1], '')):
+            return candidate
+    return None
+
+def link_one_command(args):
+    from link_one import link_one
+
+    status = 0
+    for path in args.paths:
+        library = find_library(path, args.config)
+        if library is None:
+            print(f"Not inside any library: {path}")
+            status = 1
+            continue
+        kind, source, target, tracking_file, layout, link, naming_rules = library
+        if args.layout is not None and kind == "shows":
+            layout = args.layout
+        if args.naming_rules is not None:
+            naming_rules = args.naming_rules
+
+        rules = None
+        if naming_rules is not None and kind == "shows":
+            from naming_rules import load_rules
+            rules = load_rules(naming_rules)
+        linked, errors, collisions = link_one(path, kind, source, target, tracking_file, layout, link, rules)
+        for source_path, target_path in linked:
+            print(f"Linked: {source_path} -> {target_path}")
+        for target_path, sources in collisions.items():
+            print(f"Collision: {', '.join(sources)} all map to {target_path}, only linked {sources[0]}")
+        for source_path, error in errors:
+            print(f"Error processing {source_path}: {error}")
+            status = 1
+    return status
+
+def match_command(args):
+    import os
+    from fingerprint import Fingerprinter, SizeIndex, find_matches
+
+    status = 0
+    fingerprinter = Fingerprinter(workers=args.hash_workers)
+    # media folder -> SizeIndex, scanned once for all paths in it
+    indexes = {}
+    try:
+        for path in args.paths:
+            library = find_library(path, args.config)
+            if library is None:
+                print(f"Not inside any library: {path}")
+                status = 1
+                continue
+            target = library[2]
+            if target not in indexes:
+                indexes[target] = SizeIndex().scan(target)
+
+            files = [path]
+            if os.path.isdir(path):
+                files = sorted(os.path.join(dir_path, name) for dir_path, _, names in os.walk(path) for name in names)
+            for file_path, matches in find_matches(files, indexes[target], fingerprinter).items():
+                if matches:
+                    for media_path in matches:
+                        print(f"Same content: {file_path} = {media_path}")
+                else:
+                    print(f"No match: {file_path}")
+    finally:
+        fingerprinter.close()
+    return status
+
+def run_command(args):
+    from hardlink_engine import main
+    main(args.args, prog="hardlink_cli.py run")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hardlink downloads into the media library.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    link_parser = subparsers.add_parser("link-one", help="link just these files or folders, e.g. from a download client hook")
+    link_parser.add_argument("paths", nargs="+", metavar="path")
+    link_parser.add_argument("--config", metavar="FILE",
+                             help="engine config with the libraries (default: downloads/shows and downloads/movies here)")
+    link_parser.add_argument("--layout", choices=["mirror", "season"], help="layout for shows, overrides the config")
+    link_parser.add_argument("--naming-rules", metavar="FILE", help="rules file for shows, overrides the config")
+    link_parser.set_defaults(func=link_one_command)
+
+    match_parser = subparsers.add_parser("match", help="find media files with the same content as these downloads")
+    match_parser.add_argument("paths", nargs="+", metavar="path")
+    match_parser.add_argument("--config", metavar="FILE",
+                              help="engine config with the libraries (default: downloads/shows and downloads/movies here)")
+    match_parser.add_argument("--hash-workers", type=int, metavar="N", help="fingerprint on N processes")
+    match_parser.set_defaults(func=match_command)
+
+    run_parser = subparsers.add_parser("run", help="process every library of a config file, see hardlink_engine.py")
+    run_parser.add_argument("args", nargs=argparse.REMAINDER)
+    run_parser.set_defaults(func=run_command)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,645 @@
+import os
+import sys
+import json
+import time
+import signal
+import asyncio
+import threading
+import argparse
+from pathlib import Path
+from operator import itemgetter
+from itertools import groupby
+from collections import Counter
+
+from tracking_store import TrackingStore
+from name_classifier import DEFAULT_MATCHER, classify_name
+from naming_rules import load_rules
+from parse_cache import ParseCache
+from scan_index import ScanIndex
+from walker import scan_tree
+from link_executor import LinkExecutor
+from link_planner import plan_folder, resolve_collisions, merge_collisions, sort_plan, print_plan, execute_batches
+from inode_index import InodeIndex, check_plan, print_check_summary, print_check_details
+from progress import Progress
+from checkpoint import Checkpoint
+from show_layout import LAYOUTS, SeasonLayout
+from link_methods import LinkChain
+from orchestrator import run_concurrently
+from tracking_index import PruneRefused, prune_links, print_prune_results
+from profiling import Profiler
+from fingerprint import FingerprintCache, Fingerprinter, SizeIndex, match_plan, print_match_summary, print_match_details
+
+KINDS = ('shows', 'movies')
+
+class Stopped(Exception):
+    """
+    Raised in a library's thread when a concurrent run is told to stop.
+    """
+
+def create_hardlink(source_path, target_path):
+    os.link(source_path, target_path)
+
+def sanitize_show_filename(filename, parse_cache=None, rules=None):
+    """
+    Build the cleaned up name for an episode, movie or extra, with rules (a
+    NameMatcher, the default rules without one).
+    Returns None for temporary files that should be skipped.
+    Names already in the parse cache are not parsed again.
+    """
+    if parse_cache is not None:
+        parsed = parse_cache.classify(filename)
+    else:
+        parsed = rules.classify(filename) if rules is not None else classify_name(filename)
+
+    if parsed.kind == 'unknown':
+        print(f"No match found for: {filename}")
+    return parsed.name
+
+def show_target_file(name, target_path, is_in_featurettes, parse_cache=None, rules=None):
+    """
+    Work out where a file from a show folder should be linked to.
+    Returns None for temporary downloads that should be skipped.
+    """
+    new_filename = sanitize_show_filename(name, parse_cache, rules)
+
+    if new_filename is None:
+        print(f"Skipping temporary file: {name}")
+        return None  # Skip this file and move to the next one
+
+    if is_in_featurettes:
+        return target_path / name
+    return target_path / new_filename
+
+def plan_shows(source_path, target_path, scan_index=None, parse_cache=None, progress=None, resume_after=None, layout=None,
+               rules=None, profiler=None):
+    """
+    Walk the source tree and work out every link to make, without touching
+    the target location. Files are renamed with the naming rules (a
+    NameMatcher, the default rules without one), except inside the folders
+    the rules keep names in (Featurettes).
+    The plan is streamed as (relative_dir, items) batches, one per source
+    folder, in walk order.
+    With a scan index only new or changed files are planned, resume_after
+    is passed on to scan_tree. With a SeasonLayout episodes are placed in
+    Show (Year)/Season NN/ folders instead of mirroring the source folders
+    (primed with the folders the walk left out).
+    With a Progress object the walk and the parsing are timed and counted
+    as the discover and parse phases. With a Profiler each folder listing
+    and each parsed name is timed as well.
+    """
+    walked = 0
+    planned = 0
+    parse_seconds = 0.0
+    rules = rules or DEFAULT_MATCHER
+    classify = parse_cache.classify if parse_cache is not None else rules.classify
+    on_listed = profiler.walk_timer('walk') if profiler is not None else None
+    walk = scan_tree(source_path, scan_index, resume_after, on_listed)
+    if profiler is not None:
+        classify = profiler.wrap('parse', classify)
+    if progress is not None:
+        walk = progress.timed_iter(walk, 'discover')
+
+    #Check for Featurettes Folders above the library root once
+    root_in_featurettes = rules.keeps_names(source_path.parts)
+    target_root = str(target_path)
+    # An incremental or resumed walk leaves out folders (or files) a full
+    # run would have placed first, the layout has to look at them itself
+    prime = layout is not None and not root_in_featurettes and (scan_index is not None or resume_after is not None)
+
+    for relative_dir, items in groupby(walk, key=itemgetter(0)):
+        # Pulling the folder's files out runs the walk, so do it before timing the parse
+        entries = [entry for _, entry in items]
+        walked += len(entries)
+        is_in_featurettes = root_in_featurettes or rules.keeps_names(relative_dir.split(os.sep))
+
+        parse_start = time.perf_counter()
+        if prime:
+            layout.prime(source_path, relative_dir, rules, classify=classify)
+        plan = plan_folder(relative_dir, entries, target_root, classify, layout, is_in_featurettes)
+        parse_seconds += time.perf_counter() - parse_start
+        planned += len(plan)
+        yield relative_dir, plan
+
+    if progress is not None:
+        progress.count('discover', 'files', walked)
+        progress.count('parse', 'files', walked)
+        progress.count('parse', 'skips', walked - planned)
+        progress.add_time('parse', parse_seconds)
+
+def plan_movies(source_path, target_path, scan_index=None, parse_cache=None, progress=None, resume_after=None, layout=None,
+                rules=None, profiler=None):
+    """
+    Walk the source tree and plan a link for every file, keeping the
+    folder layout and file names as they are. Streamed like plan_shows,
+    movies are always mirrored so there is no layout and no renaming.
+    """
+    walked = 0
+    on_listed = profiler.walk_timer('walk') if profiler is not None else None
+    walk = scan_tree(source_path, scan_index, resume_after, on_listed)
+    if progress is not None:
+        walk = progress.timed_iter(walk, 'discover')
+
+    target_root = str(target_path)
+    for relative_dir, items in groupby(walk, key=itemgetter(0)):
+        plan = plan_folder(relative_dir, [entry for _, entry in items], target_root)
+        walked += len(plan)
+        yield relative_dir, plan
+
+    if progress is not None:
+        progress.count('discover', 'files', walked)
+        progress.count('parse', 'files', walked)
+
+PLANNERS = {'shows': plan_shows, 'movies': plan_movies}
+
+class Library:
+    """
+    One downloads -> media library and the state files it uses. Leave
+    scan_index_file / parse_cache_file / checkpoint_file as None to turn
+    those features off. metrics_json / metrics_prom name files to write the
+    run metrics to. layout is 'mirror' (keep the source folders) or, for
+    shows, 'season' (Show (Year)/Season NN/). naming_rules is a rules file
+    to rename shows with instead of naming_rules.json. fingerprint_cache_file
+    keeps the content fingerprints of a verify run.
+    """
+
+    def __init__(self, name, kind, source, target, tracking_file, scan_index_file=None,
+                 parse_cache_file=None, metrics_json=None, metrics_prom=None, checkpoint_file=None,
+                 layout='mirror', naming_rules=None, fingerprint_cache_file=None):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown library kind {kind!r} for {name}, expected one of {', '.join(KINDS)}")
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown layout {layout!r} for {name}, expected one of {', '.join(LAYOUTS)}")
+        if layout == 'season' and kind != 'shows':
+            raise ValueError(f"The season layout is only for shows, {name} is {kind}")
+        self.name = name
+        self.kind = kind
+        # Convert to absolute paths
+        self.source = Path(source).resolve()
+        self.target = Path(target).resolve()
+        self.tracking_file = Path(tracking_file)
+        self.scan_index_file = scan_index_file
+        self.parse_cache_file = parse_cache_file
+        self.metrics_json = metrics_json
+        self.metrics_prom = metrics_prom
+        self.checkpoint_file = checkpoint_file
+        self.layout = layout
+        self.naming_rules = naming_rules
+        self.fingerprint_cache_file = fingerprint_cache_file
+
+class Engine:
+    """
+    Run several libraries (movies, shows, anime, ...) in one process.
+
+    Libraries that point at the same tracking file or parse cache share one
+    loaded copy of it, so adding a library does not cost another interpreter
+    start. Run in turn, all their links go through one worker pool; with
+    concurrent every library gets a pool of its own.
+
+    With resume, libraries that have a checkpoint left by an interrupted
+    run carry on after the last committed batch.
+
+    link_methods is the fallback chain to use when a hardlink is not
+    possible, e.g. ('hardlink', 'reflink', 'copy') for a media folder on
+    another filesystem (see link_methods.LinkChain). copy_workers and
+    bandwidth (bytes per second) limit the copies.
+
+    With concurrent, the libraries run at the same time instead of in turn,
+    at most device_limit of them per disk or mount (see
+    orchestrator.run_concurrently).
+
+    With a profiling.Profiler the walk, parsing, mkdir, links and tracking
+    writes are timed, and its report is printed at the end of the run.
+
+    With verify, new downloads are compared by content with the media files
+    of the same size (sampled fingerprints, hashed on hash_workers
+    processes, see fingerprint.match_plan). Downloads whose content is
+    already in the media folder are not linked again, and targets that
+    hold a different file are reported as replacements.
+    """
+
+    def __init__(self, libraries, workers=1, dry_run=False, inode_check=False, resume=False,
+                 link_methods=('hardlink',), copy_workers=2, bandwidth=None, concurrent=False, device_limit=1,
+                 profiler=None, verify=False, hash_workers=None):
+        self.libraries = libraries
+        self.concurrent = concurrent
+        self.device_limit = device_limit
+        self.workers = workers
+        self.dry_run = dry_run
+        self.inode_check = inode_check
+        self.resume = resume
+        self.verify = verify
+        self.hash_workers = hash_workers
+        self.link = create_hardlink
+        self.chain = None
+        if tuple(link_methods) != ('hardlink',):
+            self.link = self.chain = LinkChain(link_methods, copy_workers, bandwidth)
+        self.makedirs = os.makedirs
+        self.profiler = profiler
+        if profiler is not None:
+            self.link = profiler.wrap('link', self.link)
+            self.makedirs = profiler.wrap('mkdir', self.makedirs)
+        # file path -> loaded state, shared between libraries
+        self.tracking_stores = {}
+        self.parse_caches = {}
+        self.matchers = {}
+        # library name -> Progress of its run
+        self.progress = {}
+        # Set to stop the libraries of a concurrent run at their next folder
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+
+    def tracking_store(self, library):
+        key = str(library.tracking_file.resolve())
+        with self.lock:
+            if key not in self.tracking_stores:
+                library.tracking_file.parent.mkdir(parents=True, exist_ok=True)
+                self.tracking_stores[key] = TrackingStore(library.tracking_file)
+                if self.profiler is not None:
+                    # add() flushes through this too, every batch written is timed
+                    self.profiler.wrap_method(self.tracking_stores[key], 'flush', 'track', key)
+            return self.tracking_stores[key]
+
+    def matcher(self, library):
+        if library.naming_rules is None:
+            return DEFAULT_MATCHER
+        key = str(Path(library.naming_rules).resolve())
+        with self.lock:
+            if key not in self.matchers:
+                self.matchers[key] = load_rules(key)
+            return self.matchers[key]
+
+    def parse_cache(self, library):
+        if library.parse_cache_file is None:
+            return None
+        matcher = self.matcher(library)
+        key = str(Path(library.parse_cache_file).resolve())
+        with self.lock:
+            if key not in self.parse_caches:
+                self.parse_caches[key] = ParseCache(library.parse_cache_file, matcher=matcher)
+            return self.parse_caches[key]
+
+    def executor(self):
+        return LinkExecutor(self.workers, link=self.link, makedirs=self.makedirs)
+
+    def plan(self, library, scan_index, progress, unprocessed_files, collisions, resume_after=None):
+        """
+        Plan a library one source folder at a time: walk, parse, drop
+        collisions and, with inode_check, what is already linked. Yields
+        (relative_dir, sorted items) batches, so only one folder of the plan
+        is in memory at a time. The collisions found are added to
+        collisions. With verify, duplicates by content are dropped as well.
+        """
+        inode_index = None
+        if self.inode_check:
+            inode_index = InodeIndex().scan(library.target)
+            source_dev = os.stat(library.source).st_dev
+            already_count = mismatched_count = 0
+        fingerprinter = None
+        if self.verify:
+            size_index = SizeIndex().scan(library.target)
+            cache = FingerprintCache(library.fingerprint_cache_file) if library.fingerprint_cache_file is not None else None
+            fingerprinter = Fingerprinter(cache, self.hash_workers)
+            duplicate_count = replacement_count = 0
+
+        layout = SeasonLayout(library.target) if library.layout == 'season' else None
+        # Source folders only collide with each other when they share target folders
+        planned = {} if layout is not None else None
+        planner = PLANNERS[library.kind]
+        try:
+            for relative_dir, plan in planner(library.source, library.target, scan_index,
+                                              self.parse_cache(library), progress, resume_after, layout,
+                                              self.matcher(library), self.profiler):
+                if self.stop.is_set():
+                    raise Stopped(library.name)
+                plan, found = resolve_collisions(plan, planned)
+                merge_collisions(collisions, found)
+                plan = sort_plan(plan)
+
+                if inode_index is not None:
+                    plan, already_linked, mismatched = check_plan(plan, inode_index, source_dev)
+                    print_check_details(already_linked, mismatched)
+                    already_count += len(already_linked)
+                    mismatched_count += len(mismatched)
+                    unprocessed_files.extend(item.source for item, _ in mismatched)
+                if fingerprinter is not None:
+                    plan, duplicates, replacements = match_plan(plan, size_index, fingerprinter)
+                    print_match_details(duplicates, replacements)
+                    duplicate_count += len(duplicates)
+                    replacement_count += len(replacements)
+                    unprocessed_files.extend(item.source for item, _ in replacements)
+                yield relative_dir, plan
+        finally:
+            if fingerprinter is not None:
+                fingerprinter.close()
+
+        if inode_index is not None:
+            print_check_summary(already_count, mismatched_count)
+        if fingerprinter is not None:
+            print_match_summary(duplicate_count, replacement_count, fingerprinter.hashed)
+
+    def run_library(self, library, executor):
+        """
+        Plan and link one library. Returns the files that were not linked.
+        """
+        if self.profiler is not None:
+            with self.profiler.profiled():
+                return self._run_library(library, executor)
+        return self._run_library(library, executor)
+
+    def _run_library(self, library, executor):
+        print(f"Processing {library.name}: {library.source} -> {library.target}")
+        start_time = time.time()
+        unprocessed_files = []
+        collisions = {}
+        progress = self.progress[library.name] = Progress(library.name, show=not self.concurrent)
+        scan_index = ScanIndex(library.scan_index_file) if library.scan_index_file is not None else None
+        checkpoint = None
+        resume_after = None
+        if library.checkpoint_file is not None:
+            checkpoint = Checkpoint(library.checkpoint_file, library.source, library.target)
+            if self.resume and checkpoint.load():
+                resume_after = checkpoint.position
+                print(f"Resuming after {os.path.join('', *resume_after) or 'the top folder'} ({checkpoint.done} files done)")
+
+        batches = self.plan(library, scan_index, progress, unprocessed_files, collisions, resume_after)
+        if self.dry_run:
+            print_plan((item for _, plan in batches for item in plan), collisions)
+            return unprocessed_files
+
+        tracking = self.tracking_store(library)
+        link = self.link
+        # The chain is shared by the libraries of a concurrent run, count this one's links here
+        fallbacks = Counter()
+        if self.chain is not None:
+            counted = threading.Lock()
+            def link(source_path, target_path):
+                method = self.link(source_path, target_path)
+                with counted:
+                    fallbacks[method] += 1
+                return method
+        errors = execute_batches(batches, tracking, link=link, executor=executor, progress=progress,
+                                 checkpoint=checkpoint, makedirs=self.makedirs)
+        if self.chain is not None:
+            for method, key in (('reflink', 'reflinks'), ('copy', 'copies')):
+                progress.count('link', key, fallbacks[method])
+            if fallbacks['reflink'] or fallbacks['copy']:
+                print(f"\nNot hardlinked: {fallbacks['reflink']} reflinked, {fallbacks['copy']} copied")
+
+        for target, sources in collisions.items():
+            print(f"\nCollision: {', '.join(sources)} all map to {target}, only linked {sources[0]}")
+            unprocessed_files.extend(sources[1:])
+
+        for source_file, error in errors:
+            print(f"\nError processing {source_file}: {error}")
+            unprocessed_files.append(source_file)
+            if scan_index is not None:
+                # Make sure the next run looks at this directory again
+                scan_index.invalidate(os.path.dirname(source_file))
+
+        with progress.timed('track'):
+            tracking.flush()
+        if scan_index is not None:
+            # A resumed walk skipped the folders before the checkpoint, keep them
+            scan_index.save(prune=resume_after is None)
+        if checkpoint is not None:
+            # Finished, the next run starts from the top again
+            checkpoint.clear()
+        progress.finish(library.metrics_json, library.metrics_prom)
+
+        print(f"\nProcessing Complete. Files processed: {progress.done}")
+        print(f"Took: {time.time() - start_time:.2f} seconds")
+        return unprocessed_files
+
+    def run(self):
+        """
+        Process every library in turn, or all at once with concurrent.
+        Returns {library name: files that were not linked}.
+        """
+        executor = None
+        if self.workers > 1 and not self.dry_run and not self.concurrent:
+            executor = self.executor()
+
+        # Turn SIGTERM (systemd stopping the unit) into a normal exit, so the
+        # finally below still writes out the tracking records. A concurrent
+        # run handles it itself, to stop the library threads first
+        previous_handler = None
+        if threading.current_thread() is threading.main_thread() and not self.concurrent:
+            previous_handler = signal.signal(signal.SIGTERM, _exit_on_sigterm)
+
+        results = {}
+        try:
+            if self.concurrent:
+                results = asyncio.run(run_concurrently(self, self.device_limit))
+            else:
+                for library in self.libraries:
+                    results[library.name] = self.run_library(library, executor)
+        finally:
+            if executor is not None:
+                executor.close()
+            for tracking in self.tracking_stores.values():
+                tracking.close()
+            if not self.dry_run:
+                for parse_cache in self.parse_caches.values():
+                    parse_cache.save()
+            if previous_handler is not None:
+                signal.signal(signal.SIGTERM, previous_handler)
+            if self.profiler is not None:
+                self.profiler.close()
+                self.profiler.report()
+        return results
+
+    def prune(self, force=False):
+        """
+        Instead of linking, delete the media files of every library whose
+        source is gone (see tracking_index.prune_links). A library whose
+        source folder, or most of the folders in it, are missing is not
+        pruned, unless force (the source folder itself always has to be
+        there).
+        Returns {library name: the (source, target) records that were
+        pruned}.
+        """
+        results = {}
+        try:
+            for library in self.libraries:
+                print(f"Pruning {library.name}: {library.target}")
+                # Hardlinks only work within one filesystem, so the source has to be on the media folder's
+                source_dev = None
+                if self.chain is None and library.target.exists():
+                    source_dev = library.target.stat().st_dev
+                try:
+                    orphans, stale, errors = prune_links(self.tracking_store(library), self.dry_run, library.target,
+                                                         library.source, source_dev, force)
+                except PruneRefused as e:
+                    print(f"Not pruning {library.name}: {e}")
+                    results[library.name] = []
+                    continue
+                print_prune_results(orphans, stale, errors, self.dry_run)
+                results[library.name] = orphans
+        finally:
+            for tracking in self.tracking_stores.values():
+                tracking.close()
+            if self.profiler is not None:
+                self.profiler.close()
+        return results
+
+def _exit_on_sigterm(signum, frame):
+    sys.exit(128 + signum)
+
+def load_config(config_file):
+    """
+    Read a JSON config file describing the libraries to process, e.g.
+
+        {
+          "state_dir": "hardlinks",
+          "workers": 4,
+          "incremental": true,
+          "verify": true,
+          "link_methods": ["hardlink", "reflink", "copy"],
+          "bandwidth_limit": 100,
+          "naming_rules": "my_naming_rules.json",
+          "libraries": [
+            {"name": "shows", "kind": "shows", "source": "downloads/shows", "target": "media/shows", "layout": "season"},
+            {"name": "movies", "kind": "movies", "source": "downloads/movies", "target": "media/movies"}
+          ]
+        }
+
+    Relative paths are taken relative to the config file. bandwidth_limit
+    is in MB/s. naming_rules (see naming_rules.Rule) can also be set per
+    library. Returns the list of Library objects and the engine options
+    (workers, inode_check, link_methods, ...).
+    """
+    config_file = Path(config_file).resolve()
+    base = config_file.parent
+    with open(config_file, 'r') as f:
+        config = json.load(f)
+
+    def path(value):
+        return base / value if value is not None else None
+
+    state_dir = path(config.get('state_dir', 'hardlinks'))
+    incremental = config.get('incremental', False)
+    use_parse_cache = config.get('parse_cache', True)
+
+    libraries = []
+    for entry in config['libraries']:
+        name = entry['name']
+        kind = entry.get('kind', name)
+
+        def state_file(key, default):
+            if key in entry:
+                return path(entry[key])
+            return state_dir / default
+
+        metrics_json = config.get('metrics_json')
+        metrics_prom = config.get('metrics_prom')
+        libraries.append(Library(
+            name, kind, path(entry['source']), path(entry['target']),
+            tracking_file=state_file('tracking_file', f"hardlinked_{name}.json"),
+            scan_index_file=state_file('scan_index_file', f"scan_index_{name}.json") if incremental else None,
+            parse_cache_file=state_file('parse_cache_file', f"parse_cache_{name}.json") if kind == 'shows' and use_parse_cache else None,
+            metrics_json=path(metrics_json.format(library=name)) if metrics_json else None,
+            metrics_prom=path(metrics_prom.format(library=name)) if metrics_prom else None,
+            checkpoint_file=state_file('checkpoint_file', f"checkpoint_{name}.json"),
+            layout=entry.get('layout', 'mirror'),
+            naming_rules=path(entry.get('naming_rules', config.get('naming_rules'))),
+            fingerprint_cache_file=state_file('fingerprint_cache_file', f"fingerprints_{name}.json"),
+        ))
+
+    options = {
+        'workers': config.get('workers', 1),
+        'inode_check': config.get('inode_check', False),
+        'link_methods': config.get('link_methods', ['hardlink']),
+        'copy_workers': config.get('copy_workers', 2),
+        'bandwidth': config['bandwidth_limit'] * 1000000 if config.get('bandwidth_limit') else None,
+        'concurrent': config.get('concurrent', False),
+        'device_limit': config.get('device_limit', 1),
+        'verify': config.get('verify', False),
+        'hash_workers': config.get('hash_workers'),
+    }
+    return libraries, options
+
+def run_config(config_file, prune=False, force=False, **overrides):
+    """
+    Programmatic entry point: load a config file and process all of its
+    libraries, or prune them. Keyword arguments override the engine
+    options from the file.
+    """
+    libraries, options = load_config(config_file)
+    options.update(overrides)
+    engine = Engine(libraries, **options)
+    return engine.prune(force) if prune else engine.run()
+
+def add_verify_arguments(parser):
+    parser.add_argument("--verify", action="store_true",
+                        help="compare new downloads with the media files by content, to skip duplicates and flag replacements")
+    parser.add_argument("--hash-workers", type=int, metavar="N",
+                        help="with --verify, fingerprint on N processes (default: one per CPU)")
+
+def add_profile_arguments(parser):
+    parser.add_argument("--profile", action="store_true",
+                        help="time the walk, parsing, mkdir, links and tracking writes and print latency histograms")
+    parser.add_argument("--slow-ms", type=float, metavar="MS",
+                        help="print every operation slower than MS milliseconds with its path (implies --profile)")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="write a Chrome trace-event file of every operation (implies --profile)")
+    parser.add_argument("--cprofile", metavar="FILE", help="write cProfile stats of the run (implies --profile)")
+
+def profiler_from_args(args):
+    """
+    A Profiler for the --profile arguments, or None when none were given.
+    """
+    if not (args.profile or args.slow_ms is not None or args.trace or args.cprofile):
+        return None
+    return Profiler(args.slow_ms, args.trace, args.cprofile)
+
+def main(argv=None, prog=None):
+    """
+    Command line entry point, also used by "hardlink_cli.py run".
+    """
+    parser = argparse.ArgumentParser(prog=prog, description="Hardlink every library described in a config file.")
+    parser.add_argument("config", help="JSON config file with the libraries to process")
+    parser.add_argument("--workers", type=int, metavar="N", help="create links on N worker threads")
+    parser.add_argument("--dry-run", action="store_true", help="print the link plans without creating anything")
+    parser.add_argument("--inode-check", action="store_true",
+                        help="index media folders by inode to skip sources that are already linked and flag wrong targets")
+    parser.add_argument("--resume", action="store_true",
+                        help="carry on from the checkpoint of an interrupted run")
+    parser.add_argument("--prune", action="store_true",
+                        help="instead of linking, delete media files whose source is gone")
+    parser.add_argument("--force", action="store_true",
+                        help="with --prune, prune even when most source folders are missing")
+    parser.add_argument("--link-methods", metavar="LIST",
+                        help="comma separated fallback chain of hardlink, reflink and copy")
+    parser.add_argument("--copy-workers", type=int, metavar="N", help="run at most N copies at once")
+    parser.add_argument("--bwlimit", type=float, metavar="MB/S", help="limit the combined copy bandwidth")
+    parser.add_argument("--concurrent", action="store_true",
+                        help="run the libraries at the same time, one per disk or mount")
+    parser.add_argument("--device-limit", type=int, metavar="N", help="with --concurrent, run up to N libraries per disk")
+    add_verify_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    overrides = {'dry_run': args.dry_run, 'resume': args.resume, 'prune': args.prune, 'force': args.force}
+    if args.workers is not None:
+        overrides['workers'] = args.workers
+    if args.inode_check:
+        overrides['inode_check'] = True
+    if args.link_methods is not None:
+        overrides['link_methods'] = args.link_methods.split(',')
+    if args.copy_workers is not None:
+        overrides['copy_workers'] = args.copy_workers
+    if args.bwlimit is not None:
+        overrides['bandwidth'] = args.bwlimit * 1000000
+    if args.concurrent:
+        overrides['concurrent'] = True
+    if args.device_limit is not None:
+        overrides['device_limit'] = args.device_limit
+    if args.verify:
+        overrides['verify'] = True
+    if args.hash_workers is not None:
+        overrides['hash_workers'] = args.hash_workers
+    overrides['profiler'] = profiler_from_args(args)
+    return run_config(args.config, **overrides)
+
+if __name__ == "__main__":
+    main()
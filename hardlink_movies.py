@@ -1,68 +1,52 @@
-import os
-import json
+import argparse
 from pathlib import Path
-import re
-import time
+
+# The linking itself lives in the shared engine
+from hardlink_engine import Engine, Library, add_verify_arguments, add_profile_arguments, profiler_from_args
 
 # def sanitize_name(name):
 #     return re.sub(r'[\s.]+', '_', name)
 
-def create_hardlink(source_path, target_path):
-    os.link(source_path, target_path)
-
-def update_tracking_file(tracking_file, source_path, target_path):
+def process_movies(source_dir, target_dir, tracking_file, scan_index_file=None, workers=1, dry_run=False, inode_check=False, metrics_json=None, metrics_prom=None, checkpoint_file=None, resume=False,
+                   link_methods=("hardlink",), copy_workers=2, bandwidth=None, profiler=None,
+                   verify=False, fingerprint_cache_file=None, hash_workers=None):
     """
-    Update the JSON tracking file with information about processed files.
-    This allows the script to keep track of which files have been hardlinked.
+    Hardlink the movie library into target_dir, keeping the folder layout.
+    The options are the same as process_tv_shows in hardlink_shows.py.
+    Returns the files that were not linked.
     """
-    # Load existing json or create an empty dictionary if file doesn't exist
-    if os.path.exists(tracking_file):
-        with open(tracking_file, 'r') as f:
-            data = json.load(f)
-    else:
-        data = {}
-    
-    # Add or Update the entry for json
-    data[str(source_path)] = str(target_path)
-
-    # Write the updated data back to the file
-    with open(tracking_file, 'w') as f:
-        json.dump(data, f, indent=2)
-
-def discover_files(directory):
-    return [f for f in Path(directory).rglob('*') if f.is_file()]
-
-def process_files(files, target_dir, tracking_file):
-
-    total_files = len(files)
-    processed_files = 0 # Using a list to allow modification in nested functions
-    start_time = time.time()
-
-    if not os.path.exists(tracking_file):
-        with open(tracking_file, 'w') as f:
-            json.dump({},f)
-
-    for file in files:
-            relative_path = file.relative_to(source_directory)
-            new_hardlink = target_dir / relative_path
-            new_hardlink.parent.mkdir(parents=True, exist_ok=True)
-            
-            processed_files += 1
-            if not new_hardlink.exists():
-                create_hardlink(str(file), str(new_hardlink))
-                update_tracking_file(tracking_file, str(file), str(new_hardlink))
-            
-            progress = (processed_files / total_files)*100
-            elapsed_time = time.time() - start_time
-            est_total_time = elapsed_time*100 / progress if progress > 0 else 0
-            est_remaining_time = est_total_time - elapsed_time
-            print(f"\rProgress: {progress:.2f}% | Processed: {processed_files}/{total_files} | Estimated remaining time: {est_remaining_time:.2f} seconds", end="")
-
-    print("\nProcessing Complete")
-    print(f"Took: {time.time() - start_time:.2f} seconds")            
+    library = Library("movies", "movies", source_dir, target_dir, tracking_file,
+                      scan_index_file=scan_index_file, metrics_json=metrics_json, metrics_prom=metrics_prom, checkpoint_file=checkpoint_file,
+                      fingerprint_cache_file=fingerprint_cache_file)
+    return Engine([library], workers=workers, dry_run=dry_run, inode_check=inode_check, resume=resume,
+                  link_methods=link_methods, copy_workers=copy_workers, bandwidth=bandwidth,
+                  profiler=profiler, verify=verify, hash_workers=hash_workers).run()["movies"]
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description="Hardlink downloaded movies into the media library.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only process directories that changed since the last run")
+    parser.add_argument("--workers", type=int, default=1, metavar="N",
+                        help="create links on N worker threads (default: 1, sequential)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print the link plan without creating anything")
+    parser.add_argument("--inode-check", action="store_true",
+                        help="index media/ by inode to skip sources that are already linked and flag wrong targets")
+    parser.add_argument("--metrics-json", metavar="FILE", help="write a JSON summary of the run metrics")
+    parser.add_argument("--metrics-prom", metavar="FILE", help="write the run metrics as a Prometheus textfile")
+    parser.add_argument("--resume", action="store_true",
+                        help="carry on from the checkpoint of an interrupted run")
+    parser.add_argument("--link-methods", default="hardlink", metavar="LIST",
+                        help="comma separated fallback chain of hardlink, reflink and copy, for a media folder "
+                             "on another filesystem (default: hardlink)")
+    parser.add_argument("--copy-workers", type=int, default=2, metavar="N",
+                        help="run at most N copies at once (default: 2)")
+    parser.add_argument("--bwlimit", type=float, metavar="MB/S", help="limit the combined copy bandwidth")
+    add_verify_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
     current_dir = Path.cwd()
     source_directory = current_dir / "downloads/movies"
     target_directory = current_dir / "media/movies"
@@ -71,9 +55,13 @@ if __name__ == "__main__":
     hardlinks_dir.mkdir(parents=True, exist_ok=True)
     # Set the tracking file path
     tracking_file = hardlinks_dir / "hardlinked_movies.json"
+    scan_index_file = hardlinks_dir / "scan_index_movies.json" if args.incremental else None
+    checkpoint_file = hardlinks_dir / "checkpoint_movies.json"
+    fingerprint_cache_file = hardlinks_dir / "fingerprints_movies.json"
 
-    print("Discovering files...")
-    files_to_process = discover_files(source_directory)
-    print(f"Found {len(files_to_process)} files to process")
-    process_files(files_to_process, target_directory, tracking_file)
-    
+    process_movies(source_directory, target_directory, tracking_file, scan_index_file=scan_index_file,
+                   workers=args.workers, dry_run=args.dry_run, inode_check=args.inode_check,
+                   metrics_json=args.metrics_json, metrics_prom=args.metrics_prom, checkpoint_file=checkpoint_file,
+                   resume=args.resume, link_methods=args.link_methods.split(","), copy_workers=args.copy_workers,
+                   bandwidth=args.bwlimit * 1000000 if args.bwlimit else None, profiler=profiler_from_args(args),
+                   verify=args.verify, fingerprint_cache_file=fingerprint_cache_file, hash_workers=args.hash_workers)
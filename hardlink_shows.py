@@ -1,65 +1,9 @@
-import os
-import json
+import argparse
 from pathlib import Path
 import re
-import time
 
-def sanitize_show_filename(filename):
-    # Patterns
-    show_pattern = r'^(.*?)\s*-?\s*S(\d+)E(\d+)\s*-?\s*(.*?)(?:\s*\((\d{4})\))?(?:\s*\((.*?)\))?\s*(\d+p)?.*?(\.[^.]+)$'
-    movie_pattern = r'^(.*?)\s*(?:\((\d{4})\))?\s*-?\s*(.*?)(?:\s*\((.*?)\))?\s*(\d+p)?.*?(\.[^.]+)$'
-    extra_pattern = r'^(.*?)(?:\s*\((\d{4})\))?(\.[^.]+)$'
-    temp_file_pattern = r'^\.([a-f0-9]+)\.parts$'
-
-    # Check for temporary files
-    if re.match(temp_file_pattern, filename):
-        return None  # Skip temporary files
-
-    # Try matching show pattern
-    match = re.match(show_pattern, filename, re.IGNORECASE)
-    if match:
-        show_name, season, episode, episode_name, year, extra_info, quality, extension = match.groups()
-        new_filename = f"{show_name.strip()}"
-        if year:
-            new_filename += f" ({year})"
-        new_filename += f" S{season.zfill(2)}E{episode.zfill(2)}"
-        if episode_name:
-            new_filename += f" - {episode_name.strip()}"
-        if quality:
-            new_filename += f" {quality}"
-        if extra_info:
-            new_filename += f" ({extra_info})"
-        new_filename += extension
-        return new_filename
-
-    # Try matching movie pattern
-    match = re.match(movie_pattern, filename, re.IGNORECASE)
-    if match:
-        movie_name, year, extra_name, extra_info, quality, extension = match.groups()
-        new_filename = f"{movie_name.strip()}"
-        if year:
-            new_filename += f" ({year})"
-        if extra_name:
-            new_filename += f" - {extra_name.strip()}"
-        if quality:
-            new_filename += f" {quality}"
-        if extra_info:
-            new_filename += f" ({extra_info})"
-        new_filename += extension
-        return new_filename
-
-    # Try matching extra content pattern
-    match = re.match(extra_pattern, filename, re.IGNORECASE)
-    if match:
-        extra_name, year, extension = match.groups()
-        new_filename = f"{extra_name.strip()}"
-        if year:
-            new_filename += f" ({year})"
-        new_filename += extension
-        return new_filename
-
-    print(f"No match found for: {filename}")
-    return filename
+# The linking itself lives in the shared engine
+from hardlink_engine import Engine, Library, add_verify_arguments, add_profile_arguments, profiler_from_args
 
 def sanitize_folder_name(name):
     """
@@ -68,117 +12,37 @@ def sanitize_folder_name(name):
     """
     return re.sub(r'[\s.]+', '_', name)
 
-def create_hardlink(source_path, target_path):
-    """
-    Replace spaces and dots in the name with underscores.
-    This helps create more uniform directory names.
-    """
-    os.link(source_path, target_path)
-
-def update_tracking_file(tracking_file, source_path, target_path):
-    """
-    Update the JSON tracking file with information about processed files.
-    This allows the script to keep track of which files have been hardlinked.
-    """
-    # Load existing json or create an empty dictionary if file doesn't exist
-    if os.path.exists(tracking_file):
-        with open(tracking_file, 'r') as f:
-            data = json.load(f)
-    else:
-        data = {}
-    
-    # Add or Update the entry for json
-    data[str(source_path)] = str(target_path)
-
-    # Write the updated data back to the file
-    with open(tracking_file, 'w') as f:
-        json.dump(data, f, indent=2)
-
-def process_directory(source_dir, target_dir, tracking_file, processed_files, total_files, start_time, unprocessed_files):
-    """
-    Recursively process a directory, creating hardlinks for all files
-    and recreating the directory structure in the target location.
-    """
-    source_path = Path(source_dir)
-    target_path = Path(target_dir)
-
-    # Create the target directory if it doesn't exists (it literally doesn't exists?)
-    if not target_path.exists():
-        target_path.mkdir(parents=True)
-    
-    #Check for Featurettes Folders
-    is_in_featurettes = any(part.lower() == "featurettes" for part in source_path.parts)
-
-    # Iterate through all items in the source directory, this is where the fun begins
-    for item in source_path.iterdir():
-        try:
-            if item.is_dir():
-                # If it's a folder, process it recursively
-                new_target = target_path / item.name # removed folder sanitizing
-                process_directory(item, new_target, tracking_file, processed_files, total_files, start_time, unprocessed_files)
-            elif item.is_file():
-                new_filename = sanitize_show_filename(item.name)
-                
-                if new_filename is None:
-                    print(f"Skipping temporary file: {item.name}")
-                    continue  # Skip this file and move to the next one
-                
-                if is_in_featurettes:
-                    relative_path = item.relative_to(source_path)
-                    new_file = target_path / relative_path
-                    new_file.parent.mkdir(parents=True, exist_ok=True)
-                else:
-                    new_file = target_path / new_filename
-
-                processed_files[0] += 1
-                if not new_file.exists():
-                    create_hardlink(item, new_file)
-                    update_tracking_file(tracking_file, str(item), str(new_file))
-
-                # Update and Display progress
-                progress = (processed_files[0] / total_files)*100
-                elapsed_time = time.time() - start_time
-                est_total_time = elapsed_time*100 / progress if progress > 0 else 0
-                est_remaining_time = est_total_time - elapsed_time
-                print(f"\rProgress: {progress:.2f}% | Processed: {processed_files[0]}/{total_files} | Estimated remaining time: {est_remaining_time:.2f} seconds", end="")
-    
-        except Exception as e:
-            print(f"\nError processing {item}: {str(e)}")
-            unprocessed_files.append(str(item))
-    
-    # if is_in_featurettes:
-    #     print(f"\nProcessed Featurette Directory: {source_path}")
-
-def process_tv_shows(source_dir, target_dir, tracking_file):
+def process_tv_shows(source_dir, target_dir, tracking_file, scan_index_file=None, workers=1, parse_cache_file=None, dry_run=False, inode_check=False, metrics_json=None, metrics_prom=None, checkpoint_file=None, resume=False, layout="mirror",
+                     link_methods=("hardlink",), copy_workers=2, bandwidth=None, naming_rules=None,
+                     profiler=None, verify=False, fingerprint_cache_file=None, hash_workers=None):
     """
     Main function to process the entire TV show library.
-    Sets up the environment and initiates the recursive processing.
+    Sets up the environment and initiates the processing.
+    With scan_index_file set, only directories that changed since the last
+    run are processed. With more than one worker the links are created on a
+    thread pool. With parse_cache_file set, parsed filenames are remembered
+    between runs. With dry_run the link plan is printed and nothing is
+    changed. With inode_check the target tree is indexed by inode first to
+    find what is already linked. metrics_json / metrics_prom name files to
+    write the run metrics to. With checkpoint_file set the position is
+    saved as links are committed, and resume carries on from there. With
+    layout "season" episodes go to Show (Year)/Season NN/ folders instead of
+    mirroring downloads/. link_methods, copy_workers and bandwidth set up
+    the fallback when media/ is on another filesystem, see Engine.
+    naming_rules is a rules file to use instead of naming_rules.json. With
+    a profiling.Profiler the hot path is timed, see Engine. With verify new
+    downloads are compared with media/ by content, the fingerprints are
+    kept in fingerprint_cache_file.
+    Returns the files that were not linked.
     """
-    # Convert to absolute paths
-    source_path = Path(source_dir).resolve()
-    target_path = Path(target_dir).resolve()
-
-    # Create json if it doesn't exist
-    if not os.path.exists(tracking_file):
-        with open(tracking_file, 'w') as f:
-            json.dump({}, f)
-            #Need to check how this works wrt to json.dump above
-    
-    # Count total files to process, What?
-    total_files = sum(1 for _ in source_path.rglob('*') if _.is_file())
-    processed_files = [0] # Using a list to allow modification in nested functions
-    unprocessed_files = []
-    start_time = time.time() # Not sure how this works wrt to above time.time() call
-
-    print(f"Found {total_files} files to process")
+    library = Library("shows", "shows", source_dir, target_dir, tracking_file,
+                      scan_index_file=scan_index_file, parse_cache_file=parse_cache_file,
+                      metrics_json=metrics_json, metrics_prom=metrics_prom, checkpoint_file=checkpoint_file,
+                      layout=layout, naming_rules=naming_rules, fingerprint_cache_file=fingerprint_cache_file)
+    unprocessed_files = Engine([library], workers=workers, dry_run=dry_run, inode_check=inode_check, resume=resume,
+                                link_methods=link_methods, copy_workers=copy_workers, bandwidth=bandwidth,
+                                profiler=profiler, verify=verify, hash_workers=hash_workers).run()["shows"]
 
-    #Start Recursive processing
-    process_directory(source_path, target_path, tracking_file, processed_files, total_files, start_time, unprocessed_files)
-
-    print("\nProcessing Complete.")
-    print(f"Took: {time.time() - start_time:.2f} seconds")
-    # What's :.2f notation?
-   
     # print(f"Unprocessed files: {len(unprocessed_files)}")
     # if unprocessed_files:
     #     print("\nFiles not processed for hardlinking:")
@@ -186,9 +50,39 @@ def process_tv_shows(source_dir, target_dir, tracking_file):
     #         print(file)
     # else:
         #print("\nAll files were processed successfully.")
+    return unprocessed_files
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description="Hardlink downloaded TV shows into the media library.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only process directories that changed since the last run")
+    parser.add_argument("--workers", type=int, default=1, metavar="N",
+                        help="create links on N worker threads (default: 1, sequential)")
+    parser.add_argument("--no-parse-cache", action="store_true",
+                        help="parse every filename again instead of using the saved parse cache")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="print the link plan without creating anything")
+    parser.add_argument("--inode-check", action="store_true",
+                        help="index media/ by inode to skip sources that are already linked and flag wrong targets")
+    parser.add_argument("--metrics-json", metavar="FILE", help="write a JSON summary of the run metrics")
+    parser.add_argument("--metrics-prom", metavar="FILE", help="write the run metrics as a Prometheus textfile")
+    parser.add_argument("--resume", action="store_true",
+                        help="carry on from the checkpoint of an interrupted run")
+    parser.add_argument("--layout", choices=["mirror", "season"], default="mirror",
+                        help="mirror the download folders (default) or sort episodes into Show (Year)/Season NN/")
+    parser.add_argument("--link-methods", default="hardlink", metavar="LIST",
+                        help="comma separated fallback chain of hardlink, reflink and copy, for a media folder "
+                             "on another filesystem (default: hardlink)")
+    parser.add_argument("--copy-workers", type=int, default=2, metavar="N",
+                        help="run at most N copies at once (default: 2)")
+    parser.add_argument("--bwlimit", type=float, metavar="MB/S", help="limit the combined copy bandwidth")
+    parser.add_argument("--naming-rules", metavar="FILE",
+                        help="rename with the rules in FILE instead of naming_rules.json")
+    add_verify_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
     current_dir = Path.cwd()
     source_directory = current_dir / "downloads/shows"
     target_directory = current_dir / "media/shows"
@@ -198,5 +92,16 @@ if __name__ == "__main__":
     hardlinks_dir.mkdir(exist_ok=True)
     # Set the tracking file path
     tracking_file = hardlinks_dir / "hardlinked_shows.json"
-
-    process_tv_shows(source_directory, target_directory, tracking_file)
+    scan_index_file = hardlinks_dir / "scan_index_shows.json" if args.incremental else None
+    checkpoint_file = hardlinks_dir / "checkpoint_shows.json"
+    parse_cache_file = None if args.no_parse_cache else hardlinks_dir / "parse_cache_shows.json"
+    fingerprint_cache_file = hardlinks_dir / "fingerprints_shows.json"
+
+    process_tv_shows(source_directory, target_directory, tracking_file, scan_index_file=scan_index_file,
+                     workers=args.workers, parse_cache_file=parse_cache_file, dry_run=args.dry_run,
+                     inode_check=args.inode_check, metrics_json=args.metrics_json, metrics_prom=args.metrics_prom,
+                     checkpoint_file=checkpoint_file, resume=args.resume, layout=args.layout,
+                     link_methods=args.link_methods.split(","), copy_workers=args.copy_workers,
+                     bandwidth=args.bwlimit * 1000000 if args.bwlimit else None, naming_rules=args.naming_rules,
+                     profiler=profiler_from_args(args), verify=args.verify,
+                     fingerprint_cache_file=fingerprint_cache_file, hash_workers=args.hash_workers)
@@ -0,0 +1,146 @@
+import os
+import sys
+from operator import itemgetter
+from itertools import groupby
+
+from walker import scan_tree
+from link_methods import is_copy_of
+
+class InodeIndex:
+    """
+    Map (st_dev, st_ino) to the media files that share it, built with one
+    scan of the target tree. This answers "is this source already linked
+    somewhere?" without the tracking file and without a stat per target.
+
+    Paths are not kept whole: each folder is stored once (interned) with
+    {name: inode} for its files, and each inode points back at its folder,
+    so the index costs a name and an inode number per file. Finding the
+    name of an inode means going through its folder, which is only needed
+    for files linked under another name.
+    """
+
+    def __init__(self):
+        # folder -> {name: ino}
+        self.dirs = {}
+        # folder -> st_dev of its files
+        self.devs = {}
+        # dev -> {ino: folder}, or a list of folders for inodes linked more than once
+        self.inodes = {}
+        self.count = 0
+
+    def scan(self, root):
+        """
+        Index every file under root. A missing root is simply an empty index.
+        Inodes come from the directory listing (entry.inode()) and st_dev
+        from one stat per folder, so files are never stat'ed.
+        """
+        if not os.path.isdir(root):
+            return self
+        root = str(root)
+        for relative_dir, items in groupby(scan_tree(root), key=itemgetter(0)):
+            folder = os.path.join(root, relative_dir) if relative_dir else root
+            try:
+                dev = os.stat(folder).st_dev
+            except FileNotFoundError:
+                # Removed while we were walking
+                continue
+            folder = sys.intern(folder)
+            for _, entry in items:
+                self.add_name(dev, entry.inode(), folder, entry.name)
+        return self
+
+    def add(self, key, path):
+        folder, name = os.path.split(path)
+        self.add_name(key[0], key[1], sys.intern(folder), name)
+
+    def add_name(self, dev, ino, folder, name):
+        names = self.dirs.get(folder)
+        if names is None:
+            names = self.dirs[folder] = {}
+            self.devs[folder] = dev
+        names[name] = ino
+
+        inodes = self.inodes.get(dev)
+        if inodes is None:
+            inodes = self.inodes[dev] = {}
+        folders = inodes.get(ino)
+        if folders is None:
+            inodes[ino] = folder
+            self.count += 1
+        elif isinstance(folders, str):
+            # Only build a list for the rare inode linked more than once
+            if folders is not folder:
+                inodes[ino] = [folders, folder]
+        elif folder not in folders:
+            folders.append(folder)
+
+    def target_key(self, path):
+        """
+        The (dev, ino) of the indexed file at path, or None.
+        """
+        folder, name = os.path.split(path)
+        names = self.dirs.get(folder)
+        if names is None or name not in names:
+            return None
+        return self.devs[folder], names[name]
+
+    def linked_paths(self, key):
+        """
+        All indexed paths that are hardlinks of the given (dev, ino).
+        """
+        dev, ino = key
+        folders = self.inodes.get(dev, {}).get(ino)
+        if folders is None:
+            return []
+        if isinstance(folders, str):
+            folders = [folders]
+        return [os.path.join(folder, name) for folder in folders
+                for name, other in self.dirs[folder].items() if other == ino and self.devs[folder] == dev]
+
+    def __contains__(self, key):
+        return key[1] in self.inodes.get(key[0], ())
+
+    def __len__(self):
+        return self.count
+
+def check_plan(plan, index, source_dev):
+    """
+    Split a plan using the inode index of the target tree.
+
+    Returns (todo, already_linked, mismatched):
+    - already_linked: items whose source inode is already in the target tree,
+      as (item, existing path) - possibly at another, renamed path.
+    - mismatched: items whose target path holds a different file, as
+      (item, existing path). Reflinks and copies of the source made by the
+      link fallback are not a mismatch, they count as already linked.
+    - todo: everything else, still to be linked.
+
+    All source files of a library live on one filesystem, so source_dev is
+    looked up once instead of stat'ing every source.
+    """
+    todo, already_linked, mismatched = [], [], []
+    for item in plan:
+        key = (source_dev, item.inode)
+        target_key = index.target_key(item.target)
+        if target_key == key:
+            already_linked.append((item, item.target))
+        elif key in index:
+            already_linked.append((item, index.linked_paths(key)[0]))
+        elif target_key is not None:
+            if is_copy_of(item.source, item.target):
+                already_linked.append((item, item.target))
+            else:
+                mismatched.append((item, item.target))
+        else:
+            todo.append(item)
+    return todo, already_linked, mismatched
+
+def print_check_summary(already_count, mismatched_count):
+    print(f"Already linked: {already_count} | Wrong file at target: {mismatched_count}")
+
+def print_check_details(already_linked, mismatched):
+    for item, existing in already_linked:
+        if existing != item.target:
+            print(f"Already linked elsewhere: {item.source} -> {existing}")
+    for item, existing in mismatched:
+        print(f"Mismatch: {existing} is not a link of {item.source}")
@@ -0,0 +1,119 @@
+import os
+import queue
+import threading
+from pathlib import Path
+
+class LinkExecutor:
+    """
+    Create hardlinks on a bounded pool of worker threads.
+
+    Discovery submits (source, target) pairs into a bounded queue, so it can
+    never run too far ahead of the workers. The workers create the target's
+    parent folder (each folder only once), check whether the target exists
+    and link it. On network filesystems this keeps several metadata round
+    trips in flight instead of waiting for each one in turn.
+
+    Files that fail are collected in `errors` as (source, message) pairs,
+    the same way unprocessed_files is filled in the sequential mode.
+
+    One executor can be shared by several libraries: each job can carry its
+    own tracking store and link function, and drain() waits for the submitted jobs without
+    stopping the workers.
+    """
+
+    def __init__(self, workers, tracking=None, link=os.link, queue_size=None, makedirs=os.makedirs):
+        self.tracking = tracking
+        self.link = link
+        self.makedirs = makedirs
+        self.queue = queue.Queue(maxsize=queue_size or workers * 64)
+        self.errors = []
+        self.drained_errors = 0
+        self.completed = 0
+        self.linked = 0
+
+        self.lock = threading.Lock()
+        # folder -> Event that is set once the folder exists
+        self.dirs = {}
+
+        self.threads = [threading.Thread(target=self.worker, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, source_path, target_path, tracking=None, link=None):
+        """
+        Queue a link. Blocks while the queue is full.
+        """
+        if tracking is None:
+            tracking = self.tracking
+        self.queue.put((str(source_path), Path(target_path), tracking, link or self.link))
+
+    def drain(self):
+        """
+        Wait until every submitted link is done. Returns the errors since the
+        last drain.
+        """
+        self.queue.join()
+        with self.lock:
+            errors = self.errors[self.drained_errors:]
+            self.drained_errors = len(self.errors)
+        return errors
+
+    def ensure_dir(self, dir_path):
+        """
+        Create a folder the first time any worker needs it. Other workers that
+        need the same folder wait for it instead of calling mkdir again.
+        """
+        with self.lock:
+            ready = self.dirs.get(dir_path)
+            owner = ready is None
+            if owner:
+                ready = self.dirs[dir_path] = threading.Event()
+
+        if owner:
+            try:
+                self.makedirs(dir_path, exist_ok=True)
+            finally:
+                ready.set()
+        else:
+            ready.wait()
+
+    def worker(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+
+            source_path, target_path, tracking, link = job
+            linked = False
+            try:
+                self.ensure_dir(target_path.parent)
+                if not target_path.exists():
+                    link(source_path, target_path)
+                    tracking.add(source_path, str(target_path))
+                    linked = True
+            except Exception as e:
+                with self.lock:
+                    self.errors.append((source_path, str(e)))
+            finally:
+                with self.lock:
+                    self.completed += 1
+                    self.linked += linked
+                self.queue.task_done()
+
+    def close(self):
+        """
+        Wait for all queued links to finish and stop the workers.
+        Returns the (source, message) errors not returned by drain() yet.
+        """
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        return self.errors[self.drained_errors:]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
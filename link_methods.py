@@ -0,0 +1,191 @@
+import os
+import errno
+import shutil
+import threading
+import time
+from collections import Counter
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows, reflinks are then never tried
+    fcntl = None
+
+METHODS = ('hardlink', 'reflink', 'copy')
+
+# From linux/fs.h, _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# Errors that mean "this method does not work for this file", as opposed
+# to a problem with the file itself, so the next method is tried
+_UNSUPPORTED = {errno.EXDEV, errno.EMLINK, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP,
+                errno.ENOTTY, errno.EINVAL, errno.ENOSYS}
+# The ones of those that hold for every file between the same two folders
+# (another filesystem, or one without the feature). EPERM (protected
+# hardlinks) and EMLINK (too many links) are about one file only.
+_FOLDER_UNSUPPORTED = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+def reflink(source_path, target_path):
+    """
+    Clone a file with the FICLONE ioctl (btrfs, XFS, ...). The copy shares
+    the source's blocks, so it is as fast as a hardlink and takes no space
+    until one of them is changed. Fails with EXDEV across filesystems and
+    EOPNOTSUPP where cloning is not supported.
+    """
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "reflinks are not supported here", str(target_path))
+    with open(source_path, 'rb') as src:
+        fd = os.open(target_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            fcntl.ioctl(fd, FICLONE, src.fileno())
+        except OSError:
+            os.close(fd)
+            os.unlink(target_path)
+            raise
+        os.close(fd)
+    shutil.copystat(source_path, target_path)
+
+class RateLimiter:
+    """
+    Token bucket shared by all copy threads, limits the combined copy
+    bandwidth to bytes_per_second.
+    """
+
+    def __init__(self, bytes_per_second):
+        self.rate = int(bytes_per_second)
+        self.lock = threading.Lock()
+        self.allowance = 0.0
+        self.last = time.monotonic()
+
+    def consume(self, n):
+        with self.lock:
+            now = time.monotonic()
+            # Allow at most a second worth of burst
+            self.allowance = min(self.allowance + (now - self.last) * self.rate, self.rate)
+            self.last = now
+            self.allowance -= n
+            wait = -self.allowance / self.rate if self.allowance < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+def copy_file(source_path, target_path, limiter=None, chunk_size=64 << 20):
+    """
+    Copy a file in the kernel with copy_file_range, or sendfile where that
+    is not available, so the data never goes through a userspace buffer.
+
+    The copy is written to a temporary file next to the target and renamed
+    over it once complete, so an interrupted copy never leaves a truncated
+    file that later runs would take for a finished one. The mtime is copied
+    too, which is how prune and the inode check recognise copies (see
+    is_copy_of).
+    """
+    target_path = str(target_path)
+    target_dir, name = os.path.split(target_path)
+    tmp_path = os.path.join(target_dir, f".{name}.copying")
+    if limiter is not None:
+        # Smaller steps so the limit is smooth
+        chunk_size = int(min(chunk_size, max(limiter.rate // 4, 1 << 20)))
+
+    with open(source_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+        try:
+            in_fd, out_fd = src.fileno(), dst.fileno()
+            use_copy_file_range = hasattr(os, 'copy_file_range')
+            offset = 0
+            while True:
+                if limiter is not None:
+                    limiter.consume(chunk_size)
+                if use_copy_file_range:
+                    try:
+                        copied = os.copy_file_range(in_fd, out_fd, chunk_size)
+                    except OSError as e:
+                        # Older kernels refuse copy_file_range across filesystems
+                        if offset or e.errno not in _UNSUPPORTED:
+                            raise
+                        use_copy_file_range = False
+                        continue
+                else:
+                    copied = os.sendfile(out_fd, in_fd, offset, chunk_size)
+                if not copied:
+                    break
+                offset += copied
+            os.fsync(out_fd)
+        except BaseException:
+            dst.close()
+            os.unlink(tmp_path)
+            raise
+    shutil.copystat(source_path, tmp_path)
+    os.replace(tmp_path, target_path)
+
+def is_copy_of(source_path, target_path):
+    """
+    Whether target is a reflink or copy made by copy_file/reflink: the
+    same size and mtime as the source. Hardlinks are recognised by inode
+    instead.
+    """
+    try:
+        source_st = os.stat(source_path)
+        target_st = os.stat(target_path)
+    except FileNotFoundError:
+        return False
+    return source_st.st_size == target_st.st_size and source_st.st_mtime_ns == target_st.st_mtime_ns
+
+class LinkChain:
+    """
+    Link a file with the first method that works: a hardlink, then a
+    reflink, then a copy, or whichever of these are in methods, in order.
+
+    A hardlink fails with EXDEV when downloads/ and media/ are on different
+    filesystems. The chain then falls through to the next method, and
+    remembers which methods cannot work for that pair of folders (EXDEV,
+    EOPNOTSUPP), so the rest of a folder does not try those calls again.
+    A method that only fails for one file (EPERM from protected hardlinks,
+    EMLINK) is tried again for the next one. Errors about the file itself
+    (missing, no permission to read, ...) are raised as before.
+
+    At most copy_workers copies run at once, however many link workers
+    there are, and bandwidth (bytes per second) limits them all together.
+    Use it anywhere a link function is taken, e.g. LinkExecutor(link=chain).
+    """
+
+    def __init__(self, methods=METHODS, copy_workers=2, bandwidth=None):
+        for method in methods:
+            if method not in METHODS:
+                raise ValueError(f"Unknown link method {method!r}, expected one of {', '.join(METHODS)}")
+        self.methods = tuple(methods)
+        self.copy_slots = threading.BoundedSemaphore(copy_workers)
+        self.limiter = RateLimiter(bandwidth) if bandwidth else None
+        self.lock = threading.Lock()
+        # (source folder, target folder) -> index of the first method that can work there
+        self.start = {}
+        # method -> files linked with it
+        self.counts = Counter()
+
+    def link(self, method, source_path, target_path):
+        if method == 'hardlink':
+            os.link(source_path, target_path)
+        elif method == 'reflink':
+            reflink(source_path, target_path)
+        else:
+            with self.copy_slots:
+                copy_file(source_path, target_path, self.limiter)
+
+    def __call__(self, source_path, target_path):
+        key = (os.path.dirname(source_path), os.path.dirname(target_path))
+        first = self.start.get(key, 0)
+        # The methods before this one cannot work for any file of the folders
+        ruled_out = first
+        for i in range(first, len(self.methods)):
+            method = self.methods[i]
+            try:
+                self.link(method, source_path, target_path)
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED or i == len(self.methods) - 1:
+                    raise
+                if e.errno in _FOLDER_UNSUPPORTED and ruled_out == i:
+                    ruled_out = i + 1
+                continue
+            with self.lock:
+                if ruled_out != first:
+                    self.start[key] = ruled_out
+                self.counts[method] += 1
+            return method
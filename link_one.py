@@ -0,0 +1,76 @@
+import os
+from operator import itemgetter
+from itertools import groupby
+
+from tracking_store import TrackingStore
+from name_classifier import DEFAULT_MATCHER
+from walker import scan_tree
+from link_planner import plan_folder, resolve_collisions, merge_collisions, sort_plan, execute_batches
+from show_layout import SeasonLayout
+
+def link_one(path, kind, source_root, target_root, tracking_file, layout='mirror', link=os.link, rules=None):
+    """
+    Link a single new download, a file or a folder, the same way a full
+    run would, without walking the rest of the library. This is what the
+    download client hooks call once per finished torrent.
+
+    The tracking records are only appended to the journal, the tracking
+    JSON itself is neither read nor rewritten (the next full run compacts
+    it). rules is the NameMatcher to rename shows with, the default naming
+    rules without one. Returns the (source, target) pairs that were linked, the
+    (source, message) errors and the collisions.
+    """
+    path = os.path.abspath(path)
+    source_root = os.path.abspath(source_root)
+    target_root = os.path.abspath(target_root)
+    relative_path = os.path.relpath(path, source_root)
+    if relative_path == os.pardir or relative_path.startswith(os.pardir + os.sep):
+        raise ValueError(f"{path} is not inside {source_root}")
+    if relative_path == os.curdir:
+        relative_path = ''
+
+    is_dir = os.path.isdir(path)
+    if is_dir:
+        batches = _walk_batches(path, relative_path)
+    else:
+        relative_dir, name = os.path.split(relative_path)
+        with os.scandir(os.path.dirname(path)) as it:
+            entries = [entry for entry in it if entry.name == name]
+        if not entries:
+            raise FileNotFoundError(f"No such file: {path}")
+        batches = [(relative_dir, entries)]
+
+    rules = rules or DEFAULT_MATCHER
+    classify = rules.classify if kind == 'shows' else None
+    season_layout = None
+    if layout == 'season':
+        season_layout = SeasonLayout(target_root)
+        # The folders above decide where non-episode files go, look at them first
+        season_layout.prime(source_root, relative_path if is_dir else relative_dir, rules, include_last=not is_dir)
+    root_in_featurettes = rules.keeps_names(source_root.split(os.sep))
+
+    collisions = {}
+    planned = {} if season_layout is not None else None
+    def plan():
+        for relative_dir, entries in batches:
+            is_in_featurettes = root_in_featurettes or rules.keeps_names(relative_dir.split(os.sep))
+            items, found = resolve_collisions(plan_folder(relative_dir, entries, target_root, classify,
+                                                          season_layout, is_in_featurettes), planned)
+            merge_collisions(collisions, found)
+            yield relative_dir, sort_plan(items)
+
+    linked = []
+    def link_and_count(source_path, target_path):
+        link(source_path, target_path)
+        linked.append((source_path, target_path))
+
+    os.makedirs(os.path.dirname(os.path.abspath(tracking_file)), exist_ok=True)
+    # Never compacts, however long the journal has grown
+    tracking = TrackingStore(tracking_file, compact_every=None)
+    errors = execute_batches(plan(), tracking, link=link_and_count)
+    tracking.flush()
+    return linked, errors, collisions
+
+def _walk_batches(path, relative_path):
+    for relative_dir, items in groupby(scan_tree(path), key=itemgetter(0)):
+        yield os.path.join(relative_path, relative_dir) if relative_dir else relative_path, [entry for _, entry in items]
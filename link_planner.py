@@ -0,0 +1,195 @@
+import os
+import time
+from collections import namedtuple, defaultdict
+
+# One planned hardlink. parent is the target folder that has to exist first.
+PlanItem = namedtuple('PlanItem', ['inode', 'source', 'target', 'parent'])
+
+def plan_folder(relative_dir, entries, target_root, classify=None, layout=None, is_in_featurettes=False):
+    """
+    Plan the links for the files of one source folder, given as their
+    os.DirEntry objects. With classify (shows) files get the cleaned up
+    name, except inside Featurettes, and temporary files are skipped.
+    Without it (movies) the names are kept. The target folder is the same
+    relative folder under target_root, or wherever the layout puts it.
+    """
+    if classify is None:
+        new_dir = os.path.join(target_root, relative_dir) if relative_dir else target_root
+        return [PlanItem(entry.inode(), entry.path, os.path.join(new_dir, entry.name), new_dir) for entry in entries]
+
+    files = []
+    by_name = {}
+    for entry in entries:
+        parsed = classify(entry.name)
+        if parsed.kind == 'temp':
+            print(f"Skipping temporary file: {entry.name}")
+            continue
+        if parsed.kind == 'unknown':
+            print(f"No match found for: {entry.name}")
+        files.append((entry.name, parsed))
+        by_name[entry.name] = entry
+
+    if layout is not None:
+        placed = layout.place(relative_dir, files, is_in_featurettes)
+    else:
+        new_dir = os.path.join(target_root, relative_dir) if relative_dir else target_root # removed folder sanitizing
+        placed = [(name, parsed, new_dir) for name, parsed in files]
+
+    plan = []
+    for name, parsed, parent in placed:
+        new_name = name if is_in_featurettes else parsed.name
+        entry = by_name[name]
+        plan.append(PlanItem(entry.inode(), entry.path, os.path.join(parent, new_name), parent))
+    return plan
+
+def find_collisions(plan):
+    """
+    Return {target: [sources]} for every target that more than one source
+    would be linked to, e.g. two releases that sanitize to the same name.
+    """
+    sources = defaultdict(list)
+    for item in plan:
+        sources[item.target].append(item.source)
+    return {target: paths for target, paths in sources.items() if len(paths) > 1}
+
+def resolve_collisions(plan, planned=None):
+    """
+    Keep only the first source (in path order) for each colliding target.
+    Returns the cleaned plan and the collisions that were found, with the
+    source that is kept first.
+
+    With planned, a {target folder: {name: source}} dict kept across the
+    batches of a streamed plan, targets an earlier batch already took are
+    dropped and reported as well, e.g. two releases of one season in the
+    season layout. Keyed by folder, the folder path is stored once and not
+    in every target.
+    """
+    collisions = find_collisions(plan)
+    if collisions:
+        collisions = {target: sorted(paths) for target, paths in collisions.items()}
+        plan = [item for item in plan if collisions.get(item.target, [item.source])[0] == item.source]
+    if planned is None:
+        return plan, collisions
+
+    kept = []
+    for item in plan:
+        names = planned.get(item.parent)
+        if names is None:
+            names = planned[item.parent] = {}
+        first = names.setdefault(os.path.basename(item.target), item.source)
+        if first == item.source:
+            kept.append(item)
+        else:
+            collisions[item.target] = [first] + collisions.get(item.target, [item.source])
+    return kept, collisions
+
+def merge_collisions(collisions, found):
+    """
+    Add the collisions of one batch to those of the earlier ones.
+    """
+    for target, sources in found.items():
+        known = collisions.setdefault(target, sources[:1])
+        known.extend(source for source in sources if source not in known)
+
+def sort_plan(plan):
+    """
+    Order the plan by target folder, so each folder is created once and the
+    links into it are made back to back.
+    """
+    return sorted(plan, key=lambda item: (item.parent, item.target))
+
+def print_plan(plan, collisions=None):
+    """
+    Dry run output: one line per planned link, then a summary. plan can be
+    any iterable, e.g. a streamed plan; collisions is read after it.
+    """
+    count = 0
+    folders = set()
+    for item in plan:
+        print(f"{item.inode}\t{item.source} -> {item.target}")
+        count += 1
+        folders.add(item.parent)
+
+    missing = sum(1 for folder in folders if not os.path.isdir(folder))
+    print(f"\nPlanned links: {count} | Target folders: {len(folders)} ({missing} to create)")
+
+    for target, sources in (collisions or {}).items():
+        print(f"Collision: {target} <- {', '.join(sources)}")
+
+def execute_plan(plan, tracking, link=os.link, executor=None, progress=None):
+    """
+    Create the links of a sorted plan. Each target folder is created once,
+    and targets that already exist are left alone.
+
+    With an executor the links are handed to its worker threads instead,
+    still made with link, and this waits for them to finish (the executor
+    stays usable).
+    With a Progress object the links, skips and errors are counted and the
+    progress line is updated. Returns the list of (source, message) errors.
+    """
+    return execute_batches([('', plan)], tracking, link, executor, progress, total=len(plan))
+
+def execute_batches(batches, tracking, link=os.link, executor=None, progress=None,
+                    checkpoint=None, checkpoint_every=1000, total=None, makedirs=os.makedirs):
+    """
+    Like execute_plan, for a plan streamed as (relative_dir, sorted items)
+    batches, one per source folder, so the whole plan never has to be in
+    memory. With a Checkpoint, once at least checkpoint_every items have
+    gone through since the last save, the tracking records are flushed and
+    the folder of the last batch is saved, so an interrupted run can be
+    resumed from there.
+    """
+    errors = []
+    done = 0
+    linked = 0
+    linked_before = executor.linked if executor is not None else 0
+    done_before = checkpoint.done if checkpoint is not None else 0
+    last_saved = 0
+    # Target folders made so far, a season folder is shared by many source folders
+    created = set()
+    # Only the time spent here, the batches are planned lazily in between
+    seconds = 0.0
+
+    for relative_dir, plan in batches:
+        start = time.perf_counter()
+        for item in plan:
+            if executor is not None:
+                executor.submit(item.source, item.target, tracking, link)
+            else:
+                try:
+                    if item.parent not in created:
+                        makedirs(item.parent, exist_ok=True)
+                        created.add(item.parent)
+                    if not os.path.exists(item.target):
+                        link(item.source, item.target)
+                        tracking.add(item.source, item.target)
+                        linked += 1
+                except Exception as e:
+                    errors.append((item.source, str(e)))
+
+            done += 1
+            if progress is not None:
+                progress.update(done, total)
+
+        if checkpoint is not None and done - last_saved >= checkpoint_every:
+            # Only move the checkpoint past links that are done and recorded
+            if executor is not None:
+                errors.extend(executor.drain())
+            tracking.flush()
+            checkpoint.save(relative_dir, done_before + done)
+            last_saved = done
+        seconds += time.perf_counter() - start
+
+    if executor is not None:
+        start = time.perf_counter()
+        errors.extend(executor.drain())
+        linked = executor.linked - linked_before
+        seconds += time.perf_counter() - start
+
+    if progress is not None:
+        progress.add_time('link', seconds)
+        progress.count('link', 'links', linked)
+        progress.count('link', 'skips', done - linked - len(errors))
+        progress.count('link', 'errors', len(errors))
+        progress.count('track', 'records', linked)
+    return errors
@@ -0,0 +1,20 @@
+from naming_rules import load_rules
+
+# The rules in naming_rules.json, loaded and compiled once at import. Use
+# naming_rules.load_rules for another rules file.
+DEFAULT_MATCHER = load_rules()
+
+def classify_name(filename):
+    """
+    Decide whether filename is a temporary .parts file, an episode, a movie
+    or an extra, and build its sanitized name, with the default naming
+    rules (see NameMatcher.classify).
+    """
+    return DEFAULT_MATCHER.classify(filename)
+
+def classify_names(names, matcher=None):
+    """
+    Classify a batch of filenames, returning a ParsedName for each.
+    """
+    classify = (matcher or DEFAULT_MATCHER).classify
+    return [classify(name) for name in names]
@@ -0,0 +1,285 @@
+import os
+import re
+import json
+import hashlib
+from string import Formatter
+from operator import itemgetter
+from collections import namedtuple
+
+# The groups every rule of a kind provides, in this order, as ParsedName.groups
+KIND_FIELDS = {
+    'temp': (),
+    'episode': ('show_name', 'season', 'episode', 'episode_name', 'year', 'info', 'quality', 'extension',
+                'last_episode'),
+    'movie': ('title', 'year', 'extra_name', 'info', 'quality', 'extension'),
+    'extra': ('title', 'year', 'extension'),
+}
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "naming_rules.json")
+
+# A namedtuple's __new__ is a Python function, the classifier calls this directly
+_tuple_new = tuple.__new__
+
+class ParsedName(namedtuple('ParsedName', ['kind', 'name', 'groups'])):
+    """
+    Result of classifying a filename. kind is one of 'temp', 'episode',
+    'movie', 'extra' or 'unknown', name is the sanitized filename (None for
+    temp files) and groups the groups of the rule that matched, in the
+    order of KIND_FIELDS.
+    """
+    __slots__ = ()
+
+    @property
+    def fields(self):
+        """
+        The parsed groups by name, built on demand so classifying a batch
+        does not pay for dicts nobody reads.
+        """
+        fields = dict(zip(KIND_FIELDS.get(self.kind, ()), self.groups))
+        for key in ('show_name', 'episode_name', 'title', 'extra_name'):
+            if fields.get(key) is not None:
+                fields[key] = fields[key].strip()
+        for key in ('season', 'episode', 'last_episode'):
+            if fields.get(key) is not None:
+                fields[key] = int(fields[key])
+        return fields
+
+class Rule:
+    """
+    One naming rule from a rules file:
+
+        {
+          "name": "sxxexx",
+          "kind": "episode",
+          "marker": "s\\d+e\\d",
+          "contains": ["."],
+          "pattern": "^(?P<show_name>.*?)\\s*-?\\s*S(?P<season>\\d+)E(?P<episode>\\d+)...$",
+          "ignore_case": true,
+          "defaults": {"season": "1"},
+          "strip": ["show_name"],
+          "format": ["{show_name}", " ({year})", " S{season:0>2}E{episode:0>2}", "{extension}"]
+        }
+
+    The prefilters say which names the rule can match at all, and are
+    checked before its pattern runs: prefix (the name starts with one of
+    them), extensions (the name ends with one of them, any case), contains
+    (every one of these is in the name) and marker (a regex that has to be
+    found somewhere in the name). The marker is case sensitive even when
+    the pattern is not, spell both cases out ([sS]): a search that starts
+    with a plain character skips ahead much faster.
+
+    The pattern names its groups after KIND_FIELDS. defaults fill in groups
+    the pattern does not have or that did not match. format is the new
+    name, one piece at a time: a piece is only added when all the fields it
+    uses are non-empty, the fields in strip have their whitespace stripped.
+    A rule without a format (temp files) gives the name None.
+    """
+
+    def __init__(self, spec):
+        self.name = spec['name']
+        self.kind = spec['kind']
+        if self.kind not in KIND_FIELDS:
+            raise ValueError(f"Unknown kind {self.kind!r} in naming rule {self.name}, "
+                             f"expected one of {', '.join(KIND_FIELDS)}")
+        self.pattern = spec['pattern']
+        self.ignore_case = spec.get('ignore_case', False)
+        self.prefixes = tuple(_as_list(spec.get('prefix')))
+        self.extensions = tuple(extension.lower() for extension in _as_list(spec.get('extensions')))
+        self.contains = tuple(_as_list(spec.get('contains')))
+        self.marker_pattern = spec.get('marker')
+        self.defaults = spec.get('defaults', {})
+        self.strip = set(spec.get('strip', ()))
+        self.format = spec.get('format')
+
+        fields = KIND_FIELDS[self.kind]
+        for field in self.defaults:
+            if field not in fields:
+                raise ValueError(f"Naming rule {self.name} has a default for {field}, which {self.kind} names do not have")
+        self.regex = re.compile(self.pattern, re.IGNORECASE if self.ignore_case else 0)
+        self.match = self.regex.match
+        # match -> ParsedName, see _compile_parse
+        self.parse = _compile_parse(self, fields)
+        self.marker = re.compile(self.marker_pattern).search if self.marker_pattern else None
+        # The first character of the prefixes is already checked by NameMatcher
+        self.long_prefixes = self.prefixes if any(len(prefix) > 1 for prefix in self.prefixes) else ()
+        # Only names with an extension have a dot, see NameMatcher._candidates
+        self.other_contains = tuple(text for text in self.contains if text != '.')
+
+def _as_list(value):
+    if value is None:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+def _compile_parse(rule, fields):
+    """
+    Turn a rule into a function of a match of its pattern that returns the
+    ParsedName. Everything that only depends on the rule is worked out
+    here, once: where each field is in match.groups(), the defaults and the
+    format pieces, as (indexes of the fields used, format string with the
+    fields by index).
+
+    Which pieces go into a name only depends on which of their fields are
+    empty, so the pieces are joined into one format string per combination
+    of empty fields, the first time it comes up.
+    """
+    # Fields the pattern does not have point at a None added after the groups
+    missing = rule.regex.groups
+    positions = [rule.regex.groupindex[field] - 1 if field in rule.regex.groupindex else missing for field in fields]
+    pad = (None,) if missing in positions else ()
+    defaults = tuple((index, rule.defaults[field]) for index, field in enumerate(fields) if field in rule.defaults)
+    strip = tuple(index for index, field in enumerate(fields) if field in rule.strip)
+
+    pieces = []
+    for part in rule.format or ():
+        used = set()
+        text = ''
+        for literal, field, spec, conversion in Formatter().parse(part):
+            text += literal.replace('{', '{{').replace('}', '}}')
+            if field is None:
+                continue
+            if field not in fields or conversion or '{' in spec:
+                raise ValueError(f"Bad field {{{field}}} in the format of naming rule {rule.name}")
+            index = fields.index(field)
+            used.add(index)
+            text += f"{{{index}:{spec}}}" if spec else f"{{{index}}}"
+        if text:
+            pieces.append((tuple(sorted(used)), text))
+    def format_for(present):
+        text = ''.join(text for used, text in pieces if all(present[index] for index in used))
+        formats[present] = text.format
+        return text.format
+
+    kind = rule.kind
+    # Most rules have the fields as their groups, in order
+    in_order = positions == list(range(missing))
+    values_of = itemgetter(*positions) if len(positions) > 1 else lambda groups: (groups[positions[0]],)
+    # Which fields are non-empty -> the format of the pieces that apply
+    formats = {}
+
+    if rule.format is None:
+        def parse(match):
+            return _tuple_new(ParsedName, (kind, None, values_of(match.groups() + pad) if positions else ()))
+        return parse
+
+    def parse(match):
+        values = match.groups() if in_order else values_of(match.groups() + pad)
+        if defaults:
+            values = list(values)
+            for index, default in defaults:
+                if values[index] is None:
+                    values[index] = default
+            values = tuple(values)
+        present = tuple(map(bool, values))
+        try:
+            format = formats[present]
+        except KeyError:
+            format = format_for(present)
+        if strip:
+            shown = list(values)
+            for index in strip:
+                if shown[index]:
+                    shown[index] = shown[index].strip()
+            return _tuple_new(ParsedName, (kind, format(*shown), values))
+        return _tuple_new(ParsedName, (kind, format(*values), values))
+    return parse
+
+class NameMatcher:
+    """
+    All naming rules compiled into one matcher.
+
+    The rules that can match a name are picked with a dict lookup on its
+    first character and extension (the prefix and extensions prefilters),
+    computed once per combination, so rules for other kinds of names cost
+    nothing per file. The rules left are tried in order, the first one
+    whose prefilters pass and whose pattern matches wins. Rules with the
+    same marker share its search.
+
+    keep_names_in are folder names (e.g. Featurettes) whose files keep
+    their original names.
+    """
+
+    def __init__(self, rules, keep_names_in=()):
+        self.rules = [rule if isinstance(rule, Rule) else Rule(rule) for rule in rules]
+        self.keep_names_in = {name.lower() for name in keep_names_in}
+        # (first character, extension as is) -> (steps, shared marker slots), see _candidates
+        self.candidates = {}
+
+        digest = hashlib.sha1()
+        for rule in self.rules:
+            digest.update(json.dumps([rule.name, rule.kind, rule.pattern, rule.ignore_case, rule.prefixes,
+                                      rule.extensions, rule.contains, rule.marker_pattern, rule.defaults,
+                                      sorted(rule.strip), rule.format]).encode())
+        self.fingerprint = digest.hexdigest()
+
+    def keeps_names(self, parts):
+        """
+        Whether files in a folder with these path parts keep their names.
+        """
+        keep = self.keep_names_in
+        return any(part.lower() in keep for part in parts)
+
+    def _candidates(self, first, extension):
+        """
+        The rules that can match names with this first character and
+        extension, as steps of what classify needs of each rule, and the
+        number of marker slots. A marker only one of them uses is searched
+        directly (slot None), a marker several of them share gets a slot so
+        it is searched once per name.
+        """
+        rules = [rule for rule in self.rules
+                 if (not rule.prefixes or any(prefix[:1] == first for prefix in rule.prefixes))
+                 and (not rule.extensions or extension in rule.extensions)
+                 # A name without an extension has no dot
+                 and (extension or '.' not in rule.contains)]
+        markers = [rule.marker_pattern for rule in rules if rule.marker is not None]
+        shared = [pattern for pattern in dict.fromkeys(markers) if markers.count(pattern) > 1]
+        steps = tuple((rule.long_prefixes, rule.other_contains, rule.marker,
+                       shared.index(rule.marker_pattern) if rule.marker_pattern in shared else None,
+                       rule.match, rule.parse)
+                      for rule in rules)
+        return steps, len(shared)
+
+    def classify(self, filename):
+        """
+        Classify a filename with the first rule that matches it and build
+        its new name. Names no rule matches are 'unknown' and keep their
+        name.
+        """
+        dot = filename.rfind('.')
+        key = (filename[:1], filename[dot:] if dot >= 0 else '')
+        candidates = self.candidates.get(key)
+        if candidates is None:
+            candidates = self.candidates[key] = self._candidates(key[0], key[1].lower())
+        steps, slots = candidates
+
+        # Shared marker slot -> None (not searched yet), True or False
+        found = [None] * slots if slots else None
+        for long_prefixes, other_contains, marker, slot, match, parse in steps:
+            if long_prefixes and not filename.startswith(long_prefixes):
+                continue
+            if other_contains and not all(text in filename for text in other_contains):
+                continue
+            if marker is not None:
+                if slot is None:
+                    if marker(filename) is None:
+                        continue
+                else:
+                    has_marker = found[slot]
+                    if has_marker is None:
+                        has_marker = found[slot] = marker(filename) is not None
+                    if not has_marker:
+                        continue
+            matched = match(filename)
+            if matched is not None:
+                return parse(matched)
+        return _tuple_new(ParsedName, ('unknown', filename, ()))
+
+def load_rules(rules_file=None):
+    """
+    Read a rules file ({"keep_names_in": [...], "rules": [...]}, see Rule)
+    into a NameMatcher. Without a file the rules shipped in
+    naming_rules.json are used.
+    """
+    with open(rules_file or DEFAULT_RULES_FILE, 'r') as f:
+        config = json.load(f)
+    return NameMatcher(config['rules'], config.get('keep_names_in', ()))
@@ -0,0 +1,138 @@
+import os
+import sys
+import time
+import signal
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def device_of(path):
+    """
+    st_dev of the filesystem a path is on, or will be on once it is
+    created (the nearest existing parent).
+    """
+    path = os.path.abspath(path)
+    while True:
+        try:
+            return os.stat(path).st_dev
+        except FileNotFoundError:
+            parent = os.path.dirname(path)
+            if parent == path:
+                raise
+            path = parent
+
+def library_devices(library):
+    return sorted({device_of(library.source), device_of(library.target)})
+
+class CombinedProgress:
+    """
+    One progress line for all libraries that run at once, redrawn every
+    interval seconds from their Progress objects.
+    """
+
+    def __init__(self, progress, stream=None, interval=1.0):
+        # library name -> Progress, filled in as the libraries start
+        self.progress = progress
+        self.stream = stream if stream is not None else sys.stdout
+        self.interval = interval
+        self.start_time = time.monotonic()
+
+    def line(self):
+        parts = [f"{name}: {progress.done}" for name, progress in list(self.progress.items())]
+        done = sum(progress.done for progress in list(self.progress.values()))
+        elapsed_time = time.monotonic() - self.start_time
+        rate = done / elapsed_time if elapsed_time > 0 else 0.0
+        return f"{' | '.join(parts)} | Total: {done} | {rate:.0f} files/s"
+
+    def draw(self):
+        self.stream.write(f"\r{self.line()}")
+        self.stream.flush()
+
+    async def run(self):
+        """
+        Keep redrawing until cancelled.
+        """
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                self.draw()
+        except asyncio.CancelledError:
+            self.draw()
+            self.stream.write('\n')
+            raise
+
+async def run_concurrently(engine, device_limit=1):
+    """
+    Run all libraries of an engine at the same time, each on its own
+    thread, while at most device_limit of them use any one device (a disk,
+    an NFS export, ... told apart by st_dev) at once. A library uses the
+    devices of its source and target folder. Libraries on different
+    devices run side by side, so a sync takes about as long as the slowest
+    device instead of the sum of all of them, and libraries that share a
+    spindle do not fight over it.
+
+    The walk, the parsing and the links stay the same blocking code
+    (Engine.run_library); asyncio only schedules it onto the threads and
+    keeps one combined progress line going.
+
+    SIGTERM and SIGINT stop every library at its next folder, after which
+    this raises SystemExit, leaving the checkpoints for --resume.
+    Returns {library name: files that were not linked}.
+    """
+    loop = asyncio.get_running_loop()
+    semaphores = {}
+    for library in engine.libraries:
+        for device in library_devices(library):
+            semaphores.setdefault(device, asyncio.Semaphore(device_limit))
+
+    received = []
+    def stop(signum):
+        received.append(signum)
+        engine.stop.set()
+
+    handled = []
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop, signum)
+            handled.append(signum)
+
+    pool = ThreadPoolExecutor(max_workers=len(engine.libraries), thread_name_prefix="library")
+
+    async def run_one(library):
+        devices = library_devices(library)
+        # Always in the same order, so two libraries never wait on each other
+        for device in devices:
+            await semaphores[device].acquire()
+        executor = None
+        try:
+            if engine.stop.is_set():
+                return None
+            if engine.workers > 1 and not engine.dry_run:
+                executor = engine.executor()
+            return await loop.run_in_executor(pool, engine.run_library, library, executor)
+        finally:
+            if executor is not None:
+                executor.close()
+            for device in devices:
+                semaphores[device].release()
+
+    combined = CombinedProgress(engine.progress)
+    drawing = asyncio.ensure_future(combined.run())
+    try:
+        outcomes = await asyncio.gather(*(run_one(library) for library in engine.libraries), return_exceptions=True)
+    finally:
+        drawing.cancel()
+        await asyncio.gather(drawing, return_exceptions=True)
+        for signum in handled:
+            loop.remove_signal_handler(signum)
+        pool.shutdown()
+
+    if received:
+        raise SystemExit(128 + received[0])
+    results = {}
+    for library, outcome in zip(engine.libraries, outcomes):
+        if isinstance(outcome, BaseException):
+            raise outcome
+        results[library.name] = outcome
+    return results
@@ -0,0 +1,79 @@
+import json
+import hashlib
+from collections import OrderedDict
+from pathlib import Path
+
+from atomic_file import atomic_open
+from naming_rules import ParsedName
+from name_classifier import DEFAULT_MATCHER
+
+# Bump when the layout of a cached entry changes
+CACHE_VERSION = 2
+
+def pattern_hash(matcher=None):
+    """
+    Fingerprint of the naming rules. A cache written with other rules is
+    thrown away on load, so changing a rule invalidates it automatically.
+    """
+    digest = hashlib.sha1(str(CACHE_VERSION).encode())
+    digest.update(b'\0' + (matcher or DEFAULT_MATCHER).fingerprint.encode())
+    return digest.hexdigest()
+
+class ParseCache:
+    """
+    Persisted, size-bounded LRU cache of classify_name results keyed by
+    filename, so re-running over an already synced library skips the regex
+    work for names seen before. matcher is the NameMatcher to classify
+    with, the default naming rules without one.
+    """
+
+    def __init__(self, cache_file, max_entries=100000, matcher=None):
+        self.cache_file = Path(cache_file)
+        self.max_entries = max_entries
+        self.matcher = matcher or DEFAULT_MATCHER
+        self.key = pattern_hash(self.matcher)
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self):
+        if not self.cache_file.exists():
+            return
+        try:
+            with open(self.cache_file, 'r') as f:
+                data = json.load(f)
+        except ValueError:
+            # Unreadable cache, just start over
+            return
+        if data.get('patterns') != self.key:
+            return
+        # Saved oldest first, so the LRU order survives the round trip
+        for name, kind, new_name, groups in data['entries'][-self.max_entries:]:
+            self.entries[name] = ParsedName(kind, new_name, tuple(groups))
+
+    def classify(self, filename):
+        """
+        Same as NameMatcher.classify, but served from the cache when
+        the name has been seen before.
+        """
+        parsed = self.entries.get(filename)
+        if parsed is not None:
+            self.entries.move_to_end(filename)
+            self.hits += 1
+            return parsed
+
+        self.misses += 1
+        parsed = self.matcher.classify(filename)
+        self.entries[filename] = parsed
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return parsed
+
+    def save(self):
+        data = {
+            'patterns': self.key,
+            'entries': [[name, p.kind, p.name, p.groups] for name, p in self.entries.items()],
+        }
+        with atomic_open(self.cache_file) as f:
+            json.dump(data, f)
@@ -0,0 +1,198 @@
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+
+# Latency buckets are powers of two in microseconds, 1us .. ~67s
+BUCKETS = 27
+
+class Histogram:
+    """
+    Latency histogram of one operation, with power of two buckets so
+    recording is a bit_length() and an increment.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.buckets[min(int(seconds * 1000000).bit_length(), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """
+        Upper bound of the bucket the fraction of the operations falls in,
+        in seconds.
+        """
+        wanted = fraction * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= wanted:
+                return min((1 << i) / 1000000, self.max)
+        return self.max
+
+class Profiler:
+    """
+    Opt-in instrumentation of the hot path of a run: the directory walk,
+    parsing names, creating folders, linking and writing the tracking
+    records (walk, parse, mkdir, link, track).
+
+    Every operation goes into a latency histogram, printed with report().
+    Any single operation slower than slow_ms is printed right away with its
+    path, e.g. a link stalled on NFS. With trace_file every operation is
+    also written as a Chrome trace event (open it in chrome://tracing or
+    Perfetto), and with cprofile_file the run is profiled with cProfile.
+
+    Nothing here is touched unless a Profiler is passed in, the normal run
+    does not pay for it.
+    """
+
+    def __init__(self, slow_ms=None, trace_file=None, cprofile_file=None, stream=None):
+        self.slow = slow_ms / 1000 if slow_ms is not None else None
+        self.stream = stream if stream is not None else sys.stdout
+        self.histograms = {}
+        self.slow_count = 0
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+        self.trace = None
+        if trace_file is not None:
+            self.trace = open(trace_file, 'w')
+            self.trace.write('[\n')
+            self.trace_events = 0
+
+        self.cprofile_file = cprofile_file
+        self.profiles = []
+
+    def record(self, operation, start, seconds, path=None):
+        """
+        Add one operation that started at start (perf_counter) and took
+        seconds.
+        """
+        with self.lock:
+            histogram = self.histograms.get(operation)
+            if histogram is None:
+                histogram = self.histograms[operation] = Histogram()
+            histogram.add(seconds)
+
+            if self.slow is not None and seconds >= self.slow:
+                self.slow_count += 1
+                self.stream.write(f"\nSlow {operation}: {seconds * 1000:.1f} ms {path or ''}\n")
+                self.stream.flush()
+
+            if self.trace is not None:
+                event = {'name': operation, 'ph': 'X', 'ts': round(start * 1000000, 1),
+                         'dur': round(seconds * 1000000, 1), 'pid': self.pid, 'tid': threading.get_ident()}
+                if path is not None:
+                    event['args'] = {'path': str(path)}
+                self.trace.write((',\n' if self.trace_events else '') + json.dumps(event))
+                self.trace_events += 1
+
+    def wrap(self, operation, func):
+        """
+        Return func timed as operation, with its first argument as the path.
+        """
+        record = self.record
+        perf_counter = time.perf_counter
+
+        def timed(path, *args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(path, *args, **kwargs)
+            finally:
+                record(operation, start, perf_counter() - start, path)
+        return timed
+
+    def wrap_method(self, obj, name, operation, path=None):
+        """
+        Time a method of one object (e.g. the flush of a tracking store),
+        including the calls it makes to itself.
+        """
+        func = getattr(obj, name)
+        record = self.record
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(operation, start, perf_counter() - start, path)
+        setattr(obj, name, timed)
+
+    def walk_timer(self, operation):
+        """
+        A callback for scan_tree's on_listed, timing each folder listing of
+        a walk as operation.
+        """
+        record = self.record
+
+        def listed(dir_path, start, seconds):
+            record(operation, start, seconds, dir_path)
+        return listed
+
+    @contextmanager
+    def profiled(self):
+        """
+        Run the block under cProfile, if it was asked for. cProfile only
+        sees the thread it runs on, so this is entered on every thread that
+        runs a library and the profiles are merged when the run ends (the
+        link worker threads are not profiled, their links are timed above).
+        """
+        if self.cprofile_file is None:
+            yield
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            with self.lock:
+                self.profiles.append(profile)
+
+    def close(self):
+        """
+        Finish the trace file and write the cProfile stats.
+        """
+        if self.trace is not None:
+            self.trace.write('\n]\n')
+            self.trace.close()
+            self.trace = None
+        if self.cprofile_file is not None and self.profiles:
+            stats = pstats.Stats(self.profiles[0])
+            for profile in self.profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(self.cprofile_file)
+
+    def report(self, stream=None):
+        """
+        Print one line per operation: count, total and mean time and the
+        50th/90th/99th percentile and slowest latency.
+        """
+        stream = stream if stream is not None else self.stream
+        stream.write(f"\n{'operation':10} {'count':>9} {'total':>9} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}\n")
+        for operation, histogram in self.histograms.items():
+            values = [histogram.total, histogram.total / histogram.count, histogram.percentile(0.5),
+                      histogram.percentile(0.9), histogram.percentile(0.99), histogram.max]
+            stream.write(f"{operation:10} {histogram.count:>9} " + ' '.join(f"{_format(v):>9}" for v in values) + '\n')
+        if self.slow is not None:
+            stream.write(f"{self.slow_count} operations slower than {self.slow * 1000:g} ms\n")
+
+def _format(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f}s"
+    if seconds >= 0.001:
+        return f"{seconds * 1000:.1f}ms"
+    return f"{seconds * 1000000:.0f}us"
@@ -0,0 +1,165 @@
+import sys
+import json
+import time
+from collections import defaultdict
+
+from atomic_file import write_atomic
+
+PHASES = ('discover', 'parse', 'link', 'track')
+
+class Progress:
+    """
+    Progress line and run metrics.
+
+    The progress line is redrawn at most `rate` times per second instead of
+    on every file, which matters when a run goes through 200k files.
+    Alongside it, counters (files, links, skips, errors, ...) and elapsed
+    time are kept per phase (discover, parse, link, track), and can be
+    written out as JSON or as a Prometheus textfile at the end of the run.
+    With show=False only the numbers are kept and nothing is drawn, e.g.
+    when several libraries run at once and share one line.
+    """
+
+    def __init__(self, library='', rate=10.0, stream=None, show=True):
+        self.library = library
+        self.show = show
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.stream = stream if stream is not None else sys.stdout
+        self.counters = {phase: defaultdict(int) for phase in PHASES}
+        self.seconds = defaultdict(float)
+        self.start_time = time.monotonic()
+        self.link_start = None
+        self.last_draw = 0.0
+        self.done = 0
+        self.total = 0
+        self.drawn = 0
+
+    def count(self, phase, key, n=1):
+        self.counters[phase][key] += n
+
+    def add_time(self, phase, seconds):
+        self.seconds[phase] += seconds
+
+    def timed(self, phase):
+        """
+        Context manager that adds the time spent inside it to a phase.
+        """
+        return _PhaseTimer(self, phase)
+
+    def timed_iter(self, iterable, phase):
+        """
+        Yield from iterable, adding the time spent producing each item to a
+        phase. For generators like the walker, whose work is interleaved
+        with the rest of the pipeline.
+        """
+        it = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                value = next(it)
+            except StopIteration:
+                self.seconds[phase] += time.perf_counter() - start
+                return
+            self.seconds[phase] += time.perf_counter() - start
+            yield value
+
+    def update(self, done, total=None):
+        """
+        Record how far the link phase is. Only redraws when the last redraw
+        is older than the update interval. total is None while streaming,
+        when it is not known yet.
+        """
+        self.done, self.total = done, total
+        now = time.monotonic()
+        if self.link_start is None:
+            self.link_start = now
+        if done == total or now - self.last_draw >= self.interval:
+            self.last_draw = now
+            self.draw(now)
+
+    def draw(self, now):
+        self.drawn = self.done
+        if not self.show:
+            return
+        elapsed_time = now - self.link_start
+        rate = self.done / elapsed_time if elapsed_time > 0 else 0.0
+        if self.total is None:
+            self.stream.write(f"\rProcessed: {self.done} | {rate:.0f} files/s")
+            self.stream.flush()
+            return
+        progress = (self.done / self.total)*100 if self.total else 100.0
+        est_remaining_time = (self.total - self.done) / rate if rate > 0 else 0.0
+        self.stream.write(f"\rProgress: {progress:.2f}% | Processed: {self.done}/{self.total} | "
+                          f"{rate:.0f} files/s | Estimated remaining time: {est_remaining_time:.2f} seconds")
+        self.stream.flush()
+
+    def summary(self):
+        elapsed = time.monotonic() - self.start_time
+        link_seconds = self.seconds['link']
+        return {
+            'library': self.library,
+            'elapsed_seconds': round(elapsed, 3),
+            'files_per_second': round(self.done / link_seconds, 1) if link_seconds > 0 else None,
+            'phases': {
+                phase: dict(self.counters[phase], seconds=round(self.seconds[phase], 3))
+                for phase in PHASES
+            },
+        }
+
+    def write_json(self, path):
+        write_atomic(path, json.dumps(self.summary(), indent=2) + '\n')
+
+    def write_prometheus(self, path):
+        """
+        Write the metrics in the Prometheus text format, for the node
+        exporter textfile collector.
+        """
+        summary = self.summary()
+        label = f'library="{self.library}"'
+        lines = [
+            '# HELP hardlink_run_seconds Duration of the last run.',
+            '# TYPE hardlink_run_seconds gauge',
+            f'hardlink_run_seconds{{{label}}} {summary["elapsed_seconds"]}',
+            '# HELP hardlink_phase_seconds Time spent per phase in the last run.',
+            '# TYPE hardlink_phase_seconds gauge',
+        ]
+        for phase in PHASES:
+            lines.append(f'hardlink_phase_seconds{{{label},phase="{phase}"}} {summary["phases"][phase]["seconds"]}')
+        lines += [
+            '# HELP hardlink_phase_total Counters per phase in the last run.',
+            '# TYPE hardlink_phase_total gauge',
+        ]
+        for phase in PHASES:
+            for key, value in sorted(self.counters[phase].items()):
+                lines.append(f'hardlink_phase_total{{{label},phase="{phase}",kind="{key}"}} {value}')
+        lines += [
+            '# HELP hardlink_last_run_timestamp_seconds When the last run finished.',
+            '# TYPE hardlink_last_run_timestamp_seconds gauge',
+            f'hardlink_last_run_timestamp_seconds{{{label}}} {time.time():.0f}',
+        ]
+        write_atomic(path, '\n'.join(lines) + '\n')
+
+    def finish(self, metrics_json=None, metrics_prom=None):
+        """
+        Draw the progress line one last time if it is behind (update() only
+        knows the last item when the total is known), then write the
+        requested metrics files.
+        """
+        if self.link_start is not None and self.drawn != self.done:
+            self.draw(time.monotonic())
+        if metrics_json:
+            self.write_json(metrics_json)
+        if metrics_prom:
+            self.write_prometheus(metrics_prom)
+
+class _PhaseTimer:
+    def __init__(self, progress, phase):
+        self.progress = progress
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.progress.add_time(self.phase, time.perf_counter() - self.start)
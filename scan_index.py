@@ -0,0 +1,79 @@
+import json
+import hashlib
+from pathlib import Path
+
+from atomic_file import atomic_open
+
+class ScanIndex:
+    """
+    Remember what every source directory looked like on the last run, so an
+    incremental run only has to list directories that actually changed.
+
+    Each directory is stored with its mtime and inode number, the names of
+    its subdirectories and a signature of the name and size of every file
+    in it (see file_signature), an integer instead of the whole name.
+    """
+
+    def __init__(self, index_file):
+        self.index_file = Path(index_file)
+        self.dirs = {}
+        self.seen = set()
+        if self.index_file.exists():
+            with open(self.index_file, 'r') as f:
+                self.dirs = json.load(f)
+
+    def lookup(self, dir_path, st):
+        """
+        Return the saved entry for a directory if it has not changed since
+        the last run, otherwise None.
+        """
+        entry = self.dirs.get(dir_path)
+        if entry is None:
+            return None
+        if entry['mtime'] != st.st_mtime_ns or entry['ino'] != st.st_ino:
+            return None
+        return entry
+
+    def update(self, dir_path, st, subdirs, files):
+        self.dirs[dir_path] = {
+            'mtime': st.st_mtime_ns,
+            'ino': st.st_ino,
+            'dirs': subdirs,
+            'files': files,
+        }
+
+    def mark_seen(self, dir_path):
+        self.seen.add(dir_path)
+
+    def invalidate(self, dir_path):
+        """
+        Forget a directory so the next run lists it again, e.g. because one of
+        its files could not be linked.
+        """
+        self.dirs.pop(str(dir_path), None)
+
+    def old_files(self, dir_path, st):
+        """
+        The file signatures saved for a changed directory, as a set. Empty
+        if the directory was replaced (another inode) or is new.
+        """
+        previous = self.dirs.get(dir_path)
+        if previous is None or previous.get('ino') != st.st_ino:
+            return set()
+        # Indexes of older versions kept {name: size}, their names match nothing
+        return set(previous.get('files', ()))
+
+    def save(self, prune=True):
+        # Directories that were not reached this run have been removed
+        if prune:
+            self.dirs = {path: entry for path, entry in self.dirs.items() if path in self.seen}
+        with atomic_open(self.index_file) as f:
+            json.dump(self.dirs, f)
+
+def file_signature(name, size):
+    """
+    A 64 bit hash of a file's name and size, what the scan index keeps to
+    tell new or resized files from the ones it has seen.
+    """
+    data = f"{size}/{name}".encode('utf-8', 'surrogateescape')
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
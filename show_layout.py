@@ -0,0 +1,118 @@
+import os
+import re
+
+LAYOUTS = ('mirror', 'season')
+
+# Scene names use dots or underscores between words
+_separators = re.compile(r'[\s._]+')
+
+def show_folder(show_name, year=None):
+    """
+    Folder name for a show: 'Show Name (Year)', from the show_name and
+    year groups of an episode. 'Mr.Robot.' and 'Mr Robot' end up in the
+    same folder.
+    """
+    name = _separators.sub(' ', show_name).strip(' -')
+    return f"{name} ({year})" if year else name
+
+def season_folder(season):
+    return f"Season {int(season):02d}"
+
+class SeasonLayout:
+    """
+    Lay a show library out as Show (Year)/Season NN/ from the parsed
+    episode names, whatever the folders in downloads/ look like.
+
+    Episodes are grouped by show, year and season. The target folder of a
+    group is built once and shared by all of its episodes, so a season
+    with hundreds of episodes costs one path and one mkdir. A source folder
+    whose episodes all went to one season folder is remembered, and files
+    in and below it that are not episodes (Featurettes, samples, ...) are
+    placed relative to that season folder. Anything else keeps its place
+    in the folder structure, like the mirror layout.
+
+    A run that does not list every folder (incremental or resumed) primes
+    the layout with the folders above each new file first, so those files
+    land where a full run would put them.
+    """
+
+    def __init__(self, target_root):
+        self.target_root = str(target_root)
+        # (show name, year, season) -> target folder
+        self.groups = {}
+        # relative source folder -> the season folder its episodes went to
+        self.folders = {}
+        # Source folders whose place is known from all of their files
+        self.primed = set()
+
+    def episode_dir(self, parsed):
+        show_name, season, _, _, year = parsed.groups[:5]
+        key = (show_name, year, season)
+        target_dir = self.groups.get(key)
+        if target_dir is None:
+            target_dir = self.groups[key] = os.path.join(self.target_root, show_folder(show_name, year),
+                                                         season_folder(season))
+        return target_dir
+
+    def folder_for(self, relative_dir):
+        """
+        Target folder for the files of a source folder that are not
+        episodes.
+        """
+        parts = relative_dir.split(os.sep) if relative_dir else []
+        for i in range(len(parts), 0, -1):
+            base = self.folders.get(os.sep.join(parts[:i]))
+            if base is not None:
+                return os.path.join(base, *parts[i:])
+        return os.path.join(self.target_root, relative_dir) if relative_dir else self.target_root
+
+    def place(self, relative_dir, files, is_in_featurettes):
+        """
+        Work out the target folder of every (name, parsed) file of one
+        source folder. Returns (name, parsed, target dir) for each.
+        """
+        placed = []
+        season_dirs = set()
+        if not is_in_featurettes:
+            for name, parsed in files:
+                if parsed.kind == 'episode':
+                    target_dir = self.episode_dir(parsed)
+                    season_dirs.add(target_dir)
+                    placed.append((name, parsed, target_dir))
+            # Only some of the files of a primed folder may be here
+            if len(season_dirs) == 1 and relative_dir not in self.primed:
+                self.folders[relative_dir] = season_dirs.pop()
+
+        other_dir = None
+        for name, parsed in files:
+            if is_in_featurettes or parsed.kind != 'episode':
+                if other_dir is None:
+                    other_dir = self.folder_for(relative_dir)
+                placed.append((name, parsed, other_dir))
+        return placed
+
+    def prime(self, source_root, relative_dir, rules, include_last=True, classify=None):
+        """
+        Feed all files of the folders above relative_dir (and with
+        include_last relative_dir itself) to the layout, as a full run would
+        have before getting to it. Folders are only listed once. Nothing is
+        linked. classify defaults to rules.classify.
+        """
+        classify = classify or rules.classify
+        parts = relative_dir.split(os.sep) if relative_dir else []
+        for i in range(1, len(parts) + include_last):
+            folder = os.sep.join(parts[:i])
+            if folder in self.primed:
+                continue
+            files = []
+            try:
+                with os.scandir(os.path.join(source_root, folder)) as it:
+                    for entry in it:
+                        if entry.is_file():
+                            parsed = classify(entry.name)
+                            if parsed.kind != 'temp':
+                                files.append((entry.name, parsed))
+            except FileNotFoundError:
+                continue
+            self.place(folder, sorted(files), rules.keeps_names(parts[:i]))
+            self.primed.add(folder)
@@ -0,0 +1,94 @@
+"""
+An interrupted run saves a checkpoint, check that --resume carries on
+after it and still links everything.
+
+Usage: python -m unittest discover tests
+"""
+import io
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checkpoint import Checkpoint
+from tracking_store import TrackingStore
+from link_planner import execute_batches
+from hardlink_engine import Engine, Library, plan_movies
+
+MOVIES = ("Alien (1979)", "Heat (1995)", "Ronin (1998)")
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="checkpoint_test_")
+        self.source = os.path.join(self.root, "downloads")
+        self.target = os.path.join(self.root, "media")
+        self.tracking_file = os.path.join(self.root, "tracking.json")
+        self.checkpoint_file = os.path.join(self.root, "checkpoint.json")
+        for movie in MOVIES:
+            os.makedirs(os.path.join(self.source, movie))
+            for name in (f"{movie}.mkv", f"{movie}.srt"):
+                with open(os.path.join(self.source, movie, name), "w") as f:
+                    f.write(name)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def checkpoint(self):
+        return Checkpoint(self.checkpoint_file, Path(self.source).resolve(), Path(self.target).resolve())
+
+    def run_engine(self, link=None):
+        library = Library("movies", "movies", self.source, self.target, self.tracking_file,
+                          checkpoint_file=self.checkpoint_file)
+        engine = Engine([library], resume=True)
+        if link is not None:
+            engine.link = link
+        with redirect_stdout(io.StringIO()):
+            return engine.run()["movies"]
+
+    def linked(self):
+        return sorted(os.path.relpath(os.path.join(dir_path, name), self.target)
+                      for dir_path, _, names in os.walk(self.target) for name in names)
+
+    def test_resume_after_a_crash(self):
+        linked = []
+        def crash_on_third(source_path, target_path):
+            if len(linked) == 2:
+                raise KeyboardInterrupt
+            os.link(source_path, target_path)
+            linked.append(target_path)
+
+        tracking = TrackingStore(self.tracking_file)
+        batches = plan_movies(Path(self.source).resolve(), Path(self.target).resolve())
+        with self.assertRaises(KeyboardInterrupt):
+            execute_batches(batches, tracking, link=crash_on_third, checkpoint=self.checkpoint(), checkpoint_every=1)
+        tracking.close()
+
+        checkpoint = self.checkpoint()
+        self.assertTrue(checkpoint.load())
+        self.assertEqual((checkpoint.position, checkpoint.done), ([MOVIES[0]], 2))
+
+        self.assertEqual(self.run_engine(), [])
+        self.assertEqual(len(self.linked()), 2 * len(MOVIES))
+        self.assertEqual(len(TrackingStore(self.tracking_file)), 2 * len(MOVIES))
+        # Finished, the next run starts from the top
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    def test_resume_skips_committed_folders(self):
+        self.checkpoint().save(MOVIES[1], 4)
+        self.run_engine()
+        self.assertEqual(self.linked(), [os.path.join(MOVIES[2], f"{MOVIES[2]}{ext}") for ext in (".mkv", ".srt")])
+
+    def test_checkpoint_of_other_folders_is_ignored(self):
+        Checkpoint(self.checkpoint_file, "/elsewhere", Path(self.target).resolve()).save(MOVIES[1], 4)
+        self.assertFalse(self.checkpoint().load())
+        self.run_engine()
+        self.assertEqual(len(self.linked()), 2 * len(MOVIES))
+
+if __name__ == "__main__":
+    unittest.main()
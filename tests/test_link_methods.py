@@ -0,0 +1,122 @@
+"""
+The link fallback chain: bandwidth limited copies and which failures are
+remembered per folder.
+
+Usage: python -m unittest discover tests
+"""
+import os
+import sys
+import io
+import errno
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from link_methods import LinkChain, RateLimiter, copy_file, is_copy_of
+from hardlink_engine import Engine, Library
+
+class LinkMethodsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="link_methods_test_")
+        self.source = os.path.join(self.root, "downloads")
+        self.target = os.path.join(self.root, "media")
+        os.makedirs(self.source)
+        os.makedirs(self.target)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def make_source(self, name, size=3 << 20):
+        path = os.path.join(self.source, name)
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        return path
+
+    def test_limited_copy(self):
+        # --bwlimit in MB/s gives a float
+        source_path = self.make_source("a.mkv")
+        target_path = os.path.join(self.target, "a.mkv")
+        copy_file(source_path, target_path, RateLimiter(50.5 * 1000000))
+        self.assertTrue(is_copy_of(source_path, target_path))
+        with open(source_path, "rb") as a, open(target_path, "rb") as b:
+            self.assertEqual(a.read(), b.read())
+
+    def test_chain_with_bandwidth(self):
+        chain = LinkChain(("copy",), bandwidth=50.5 * 1000000)
+        source_path = self.make_source("b.mkv")
+        self.assertEqual(chain(source_path, os.path.join(self.target, "b.mkv")), "copy")
+
+    def test_per_file_errors_are_not_remembered(self):
+        chain = FailingChain({"protected.mkv": errno.EPERM})
+        for name in ("protected.mkv", "normal.mkv"):
+            self.make_source(name, 10)
+        self.assertEqual(chain(os.path.join(self.source, "protected.mkv"), os.path.join(self.target, "protected.mkv")),
+                         "copy")
+        self.assertEqual(chain(os.path.join(self.source, "normal.mkv"), os.path.join(self.target, "normal.mkv")),
+                         "hardlink")
+        self.assertEqual(chain.start, {})
+
+    def test_other_filesystem_is_remembered(self):
+        chain = FailingChain({name: errno.EXDEV for name in ("a.mkv", "b.mkv")})
+        for name in ("a.mkv", "b.mkv"):
+            self.make_source(name, 10)
+            self.assertEqual(chain(os.path.join(self.source, name), os.path.join(self.target, name)), "copy")
+        # The second file went straight to the copy
+        self.assertEqual(chain.tried, ["hardlink", "reflink", "copy", "copy"])
+        self.assertEqual(chain.start, {(self.source, self.target): 2})
+
+    def test_fallbacks_are_counted_per_library(self):
+        self.make_source("other.mkv", 10)
+        chain = OtherLibraryChain(os.path.join(self.source, "other.mkv"), os.path.join(self.target, "other.mkv"))
+        os.makedirs(os.path.join(self.source, "movies", "Heat (1995)"))
+        self.make_source(os.path.join("movies", "Heat (1995)", "Heat (1995).mkv"), 10)
+        library = Library("movies", "movies", os.path.join(self.source, "movies"), os.path.join(self.target, "movies"),
+                          os.path.join(self.root, "hardlinked_movies.json"))
+        engine = Engine([library], link_methods=("hardlink", "copy"))
+        engine.link = engine.chain = chain
+        with redirect_stdout(io.StringIO()):
+            engine.run_library(library, None)
+        # The copy made for the other library is not counted
+        self.assertEqual(engine.progress["movies"].counters["link"]["copies"], 1)
+
+class OtherLibraryChain(LinkChain):
+    """
+    Hardlinks fail with EXDEV, and the first link of this library runs
+    while another library of a concurrent run copies one of its files.
+    """
+
+    def __init__(self, *other):
+        super().__init__(("hardlink", "copy"))
+        self.other = other
+
+    def link(self, method, source_path, target_path):
+        if method == "hardlink":
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV), source_path)
+        super().link(method, source_path, target_path)
+        if self.other:
+            other, self.other = self.other, None
+            self(*other)
+
+class FailingChain(LinkChain):
+    """
+    hardlink and reflink fail with the given errno for these file names.
+    """
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+        self.tried = []
+
+    def link(self, method, source_path, target_path):
+        self.tried.append(method)
+        name = os.path.basename(source_path)
+        if method != "copy" and name in self.failures:
+            raise OSError(self.failures[name], os.strerror(self.failures[name]), source_path)
+        super().link(method, source_path, target_path)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+Pruning deletes media files, so the cases where it must not are checked
+here on a real temporary folder tree.
+
+Usage: python -m unittest discover tests
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracking_store import TrackingStore
+from tracking_index import PruneRefused, find_orphans, prune_links
+
+class PruneTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="prune_test_")
+        self.source = os.path.join(self.root, "downloads", "shows")
+        self.target = os.path.join(self.root, "media", "shows")
+        self.tracking = TrackingStore(os.path.join(self.root, "hardlinks", "hardlinked_shows.json"))
+        os.makedirs(os.path.dirname(self.tracking.tracking_file))
+        self.links = {}
+        for show in ("Show A", "Show B"):
+            for episode in (1, 2):
+                source_path = os.path.join(self.source, show, f"{show} S01E0{episode}.mkv")
+                target_path = os.path.join(self.target, show, f"{show} S01E0{episode}.mkv")
+                os.makedirs(os.path.dirname(source_path), exist_ok=True)
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                with open(source_path, "w") as f:
+                    f.write(source_path)
+                os.link(source_path, target_path)
+                self.tracking.add(source_path, target_path)
+                self.links[source_path] = target_path
+        self.tracking.flush()
+
+    def tearDown(self):
+        self.tracking.close()
+        shutil.rmtree(self.root)
+
+    def media_files(self):
+        return sorted(os.path.join(dir_path, name) for dir_path, _, names in os.walk(self.target) for name in names)
+
+    def test_missing_source_root_is_refused(self):
+        # An unmounted export
+        os.rename(os.path.join(self.root, "downloads"), os.path.join(self.root, "moved"))
+        before = self.media_files()
+        with self.assertRaises(PruneRefused):
+            prune_links(self.tracking, stop_at=self.target, source_root=self.source)
+        with self.assertRaises(PruneRefused):
+            prune_links(self.tracking, stop_at=self.target, source_root=self.source, force=True)
+        # Without a source root the folder all sources are in is checked
+        with self.assertRaises(PruneRefused):
+            prune_links(self.tracking, stop_at=self.target)
+        self.assertEqual(self.media_files(), before)
+
+    def test_empty_mount_point_is_refused(self):
+        shutil.rmtree(self.source)
+        os.makedirs(self.source)
+        before = self.media_files()
+        with self.assertRaises(PruneRefused):
+            prune_links(self.tracking, stop_at=self.target, source_root=self.source)
+        self.assertEqual(self.media_files(), before)
+
+    def test_other_device_is_refused(self):
+        source_dev = os.stat(self.source).st_dev
+        with self.assertRaises(PruneRefused):
+            prune_links(self.tracking, stop_at=self.target, source_root=self.source, source_dev=source_dev + 1)
+
+    def test_deleted_top_level_folder_is_pruned(self):
+        # The download client removed a torrent's folder
+        shutil.rmtree(os.path.join(self.source, "Show B"))
+        orphans, _, errors = prune_links(self.tracking, stop_at=self.target, source_root=self.source)
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(target for _, target in orphans),
+                         sorted(target for source, target in self.links.items() if "Show B" in source))
+        self.assertFalse(os.path.exists(os.path.join(self.target, "Show B")))
+        self.assertEqual(len(self.media_files()), 2)
+
+    def test_most_top_level_folders_missing_needs_force(self):
+        for show in ("Show A", "Show B"):
+            shutil.rmtree(os.path.join(self.source, show))
+        # Something else is still there, so this is not an empty mount point
+        os.makedirs(os.path.join(self.source, "Show C"))
+        with self.assertRaises(PruneRefused):
+            prune_links(self.tracking, stop_at=self.target, source_root=self.source)
+        self.assertEqual(len(self.media_files()), 4)
+
+        orphans, _, errors = prune_links(self.tracking, stop_at=self.target, source_root=self.source, force=True)
+        self.assertEqual((len(orphans), errors), (4, []))
+        self.assertEqual(self.media_files(), [])
+
+    def test_deleted_source_is_pruned(self):
+        source_path = os.path.join(self.source, "Show A", "Show A S01E01.mkv")
+        os.unlink(source_path)
+        orphans, stale, errors = prune_links(self.tracking, stop_at=self.target, source_root=self.source)
+        self.assertEqual(orphans, [(source_path, self.links[source_path])])
+        self.assertEqual((stale, errors), ([], []))
+        self.assertFalse(os.path.exists(self.links[source_path]))
+        self.assertNotIn(source_path, self.tracking)
+
+    def test_moved_source_that_is_still_linked_is_kept(self):
+        # The download client moved a torrent that is still seeding
+        source_path = os.path.join(self.source, "Show A", "Show A S01E01.mkv")
+        os.rename(source_path, os.path.join(self.source, "Show A S01E01.mkv"))
+        orphans, stale = find_orphans(self.tracking)
+        self.assertEqual((orphans, stale), ([], []))
+        prune_links(self.tracking, stop_at=self.target, source_root=self.source)
+        self.assertTrue(os.path.exists(self.links[source_path]))
+
+    def test_copy_of_existing_source_is_kept(self):
+        source_path = os.path.join(self.source, "Show A", "Show A S01E02.mkv")
+        target_path = self.links[source_path]
+        os.unlink(target_path)
+        shutil.copy2(source_path, target_path)
+        self.assertEqual(find_orphans(self.tracking), ([], []))
+
+        # Once the source is gone the copy is the only one left
+        os.unlink(source_path)
+        self.assertEqual(find_orphans(self.tracking), ([(source_path, target_path)], []))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+The season layout places files by the folders above them, check that an
+incremental run puts new files where a full run would and that two
+releases of one season are reported as collisions.
+
+Usage: python -m unittest discover tests
+"""
+import io
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hardlink_engine import Engine, Library
+
+EPISODES = ("Breaking Bad (2008) - S01E01 - Pilot (1080p BluRay x265 Silence).mkv",
+            "Breaking Bad (2008) - S01E02 - Cat's in the Bag (1080p BluRay x265 Silence).mkv")
+SEASON = os.path.join("Breaking Bad (2008)", "Season 01")
+LINKED = ("Breaking Bad (2008) S01E01.mkv", "Breaking Bad (2008) S01E02.mkv")
+
+class SeasonLayoutTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="season_layout_test_")
+        self.source = os.path.join(self.root, "downloads")
+        self.target = os.path.join(self.root, "media")
+        self.release = os.path.join(self.source, "Breaking.Bad.S01.1080p")
+        os.makedirs(self.release)
+        for name in EPISODES:
+            self.write(os.path.join(self.release, name))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(path)
+
+    def run_engine(self, **options):
+        library = Library("shows", "shows", self.source, self.target, os.path.join(self.root, "tracking.json"),
+                          scan_index_file=os.path.join(self.root, "scan_index.json"), layout="season")
+        with redirect_stdout(io.StringIO()):
+            return Engine([library], **options).run()["shows"]
+
+    def test_incremental_run_places_featurettes_in_the_season(self):
+        self.run_engine()
+        self.assertEqual(sorted(os.listdir(os.path.join(self.target, SEASON))), list(LINKED))
+
+        # The release folder is unchanged, only its new Featurettes folder is listed
+        self.write(os.path.join(self.release, "Featurettes", "Behind the Scenes.mkv"))
+        self.assertEqual(self.run_engine(), [])
+        self.assertTrue(os.path.exists(os.path.join(self.target, SEASON, "Featurettes", "Behind the Scenes.mkv")))
+        self.assertFalse(os.path.exists(os.path.join(self.target, "Breaking.Bad.S01.1080p")))
+
+    def test_new_extra_in_a_listed_folder(self):
+        self.run_engine()
+        # Only the new file of the release folder is planned, not its episodes
+        self.write(os.path.join(self.release, "Sample.mkv"))
+        self.run_engine()
+        self.assertEqual(os.listdir(self.target), ["Breaking Bad (2008)"])
+
+    def test_two_releases_of_one_season_collide(self):
+        other = os.path.join(self.source, "Breaking.Bad.S01.720p", EPISODES[0].replace("1080p", "720p"))
+        self.write(other)
+        self.assertEqual(self.run_engine(), [other])
+        # The first release in walk order was linked, the other one reported
+        target_path = os.path.join(self.target, SEASON, LINKED[0])
+        self.assertTrue(os.path.samefile(target_path, os.path.join(self.release, EPISODES[0])))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+The tracking journal is shared with link_one, check that records it
+appends while a run compacts, or after a crash, are not lost.
+
+Usage: python -m unittest discover tests
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracking_store import TrackingStore
+
+class TrackingStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="tracking_store_test_")
+        self.tracking_file = os.path.join(self.root, "hardlinked_shows.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_append_during_compaction_is_kept(self):
+        store = AppendingStore(self.tracking_file)
+        store.add("/downloads/a.mkv", "/media/a.mkv")
+        store.close()
+        store.other.join()
+        self.assertEqual(dict(TrackingStore(self.tracking_file).items()),
+                         {"/downloads/a.mkv": "/media/a.mkv", "/downloads/b.mkv": "/media/b.mkv"})
+        self.assertFalse(os.path.exists(store.compacting_file))
+
+    def test_compactions_do_not_overlap(self):
+        store = AppendingStore(self.tracking_file, compact=True)
+        store.add("/downloads/a.mkv", "/media/a.mkv")
+        store.close()
+        store.other.join()
+        # Both compactions wrote the whole file, one after the other
+        with open(self.tracking_file) as f:
+            self.assertEqual(json.load(f), {"/downloads/a.mkv": "/media/a.mkv", "/downloads/b.mkv": "/media/b.mkv"})
+
+    def test_interrupted_compaction_is_folded(self):
+        store = TrackingStore(self.tracking_file)
+        store.add("/downloads/a.mkv", "/media/a.mkv")
+        store.flush()
+        os.replace(store.journal_file, store.compacting_file)
+        store = TrackingStore(self.tracking_file)
+        store.add("/downloads/b.mkv", "/media/b.mkv")
+        store.remove("/downloads/a.mkv")
+        store.close()
+        self.assertEqual(dict(TrackingStore(self.tracking_file).items()), {"/downloads/b.mkv": "/media/b.mkv"})
+        self.assertFalse(os.path.exists(store.compacting_file))
+
+    def test_append_after_a_torn_line(self):
+        store = TrackingStore(self.tracking_file)
+        store.add("/downloads/a.mkv", "/media/a.mkv")
+        store.flush()
+        # A crash in the middle of the next write
+        with open(store.journal_file, "a") as f:
+            f.write('{"source": "/downloads/b.mkv", "tar')
+        store = TrackingStore(self.tracking_file)
+        store.add("/downloads/c.mkv", "/media/c.mkv")
+        store.flush()
+        self.assertEqual(dict(store.items()), {"/downloads/a.mkv": "/media/a.mkv", "/downloads/c.mkv": "/media/c.mkv"})
+
+class AppendingStore(TrackingStore):
+    """
+    Another store (a link_one hook, the watch daemon) appends a record, and
+    with compact also compacts, while the JSON file is half written.
+    """
+
+    def __init__(self, tracking_file, compact=False):
+        super().__init__(tracking_file)
+        self.compact_other = compact
+        self.other = None
+
+    def items(self):
+        # Called by export_json, the first record is already being written
+        for i, item in enumerate(super().items()):
+            yield item
+            if i == 0 and self.other is None:
+                self.other = threading.Thread(target=self.append)
+                self.other.start()
+                # Give it time to run into the lock
+                time.sleep(0.2)
+
+    def append(self):
+        other = TrackingStore(self.tracking_file)
+        other.add("/downloads/b.mkv", "/media/b.mkv")
+        other.flush()
+        if self.compact_other:
+            other.compact()
+
+if __name__ == "__main__":
+    unittest.main()
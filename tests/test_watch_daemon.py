@@ -0,0 +1,97 @@
+"""
+The watch daemon links batches of files with state kept between events,
+check that the inode index it keeps only has real links in it and that
+it lays shows out like a full run.
+
+Usage: python -m unittest discover tests
+"""
+import io
+import os
+import sys
+import errno
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from watch_daemon import Library
+from link_methods import LinkChain, is_copy_of
+
+class WatchDaemonTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="watch_daemon_test_")
+        self.source = os.path.join(self.root, "downloads")
+        self.target = os.path.join(self.root, "media")
+        os.makedirs(self.source)
+        os.makedirs(self.target)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, path, text):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def library(self, kind="movies", **options):
+        return Library(kind, self.source, self.target, os.path.join(self.root, f"hardlinked_{kind}.json"), **options)
+
+    def test_existing_target_is_not_indexed_as_a_link(self):
+        source_path = self.write(os.path.join(self.source, "Heat (1995)", "Heat (1995).mkv"), "new download")
+        library = self.library()
+        # Another file shows up at the target after the index was built
+        target_path = self.write(os.path.join(self.target, "Heat (1995)", "Heat (1995).mkv"), "something else")
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.assertEqual(library.link([source_path]), 0)
+        library.close()
+        self.assertIn("Mismatch", output.getvalue())
+        self.assertNotIn("Linked", output.getvalue())
+        self.assertEqual(library.inode_index.linked_paths((library.source_dev, os.stat(source_path).st_ino)), [])
+        self.assertEqual(len(library.tracking), 0)
+
+    def test_season_layout(self):
+        release = os.path.join(self.source, "Breaking.Bad.S01.1080p")
+        episode = self.write(os.path.join(release, "Breaking Bad (2008) - S01E01 - Pilot (1080p BluRay x265 Silence).mkv"),
+                             "episode")
+        library = self.library("shows", layout="season")
+        # The extra arrives in an event of its own, after the episode
+        extra = self.write(os.path.join(release, "Featurettes", "Behind the Scenes.mkv"), "extra")
+        with redirect_stdout(io.StringIO()):
+            library.link([episode])
+            library.link([extra])
+        library.close()
+        season = os.path.join(self.target, "Breaking Bad (2008)", "Season 01")
+        self.assertTrue(os.path.samefile(os.path.join(season, "Breaking Bad (2008) S01E01.mkv"), episode))
+        self.assertTrue(os.path.samefile(os.path.join(season, "Featurettes", "Behind the Scenes.mkv"), extra))
+        self.assertEqual(os.listdir(self.target), ["Breaking Bad (2008)"])
+
+    def test_link_chain(self):
+        source_path = self.write(os.path.join(self.source, "Heat (1995)", "Heat (1995).mkv"), "download")
+        library = self.library(link=CrossDeviceChain(("hardlink", "copy")))
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(library.link([source_path]), 1)
+            # Already copied, not linked again
+            self.assertEqual(library.link([source_path]), 0)
+        library.close()
+        target_path = os.path.join(self.target, "Heat (1995)", "Heat (1995).mkv")
+        self.assertTrue(is_copy_of(source_path, target_path))
+        self.assertEqual(library.tracking.get(source_path), target_path)
+
+class CrossDeviceChain(LinkChain):
+    """
+    Hardlinks fail with EXDEV, as with media/ on another filesystem.
+    """
+
+    def link(self, method, source_path, target_path):
+        if method == "hardlink":
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV), source_path)
+        super().link(method, source_path, target_path)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,274 @@
+import os
+import bisect
+import argparse
+from collections import defaultdict
+
+from tracking_store import TrackingStore
+from link_methods import is_copy_of
+
+# Prune refuses when more than this share of the top level source folders
+# with records is missing. Deleting a few torrents is normal, most of the
+# library vanishing at once is a mount problem.
+MAX_MISSING_FOLDERS = 0.5
+
+class TrackingIndex:
+    """
+    Lookups over the records of a tracking store: by source, by target,
+    by inode and by source folder (e.g. "what came from this torrent?").
+
+    The source and target maps are built when the index is created. The
+    inode map is built on first use from one scandir per target folder,
+    which gets the inode numbers without a stat per file.
+    """
+
+    def __init__(self, tracking):
+        self.tracking = tracking
+        self.by_source = dict(tracking.items())
+        self.by_target = {target: source for source, target in self.by_source.items()}
+        self.sources = sorted(self.by_source)
+        # (st_dev, st_ino) -> [targets], see by_inode()
+        self.inodes = None
+
+    def target_for(self, source_path):
+        return self.by_source.get(str(source_path))
+
+    def source_for(self, target_path):
+        return self.by_target.get(str(target_path))
+
+    def under(self, source_dir):
+        """
+        All (source, target) records for sources inside a folder.
+        """
+        prefix = os.path.join(str(source_dir), '')
+        start = bisect.bisect_left(self.sources, prefix)
+        records = []
+        for source_path in self.sources[start:]:
+            if not source_path.startswith(prefix):
+                break
+            records.append((source_path, self.by_source[source_path]))
+        return records
+
+    def by_inode(self, dev, ino):
+        """
+        The tracked targets that are the file with this inode.
+        """
+        if self.inodes is None:
+            self.inodes = defaultdict(list)
+            for target_dir, names in _group_by_dir(self.by_target).items():
+                listing, dev_of_dir = _list_inodes(target_dir)
+                for name in names:
+                    if name in listing:
+                        self.inodes[(dev_of_dir, listing[name])].append(os.path.join(target_dir, name))
+        return self.inodes.get((dev, ino), [])
+
+    def lookup(self, path):
+        """
+        Everything known about a path, which can be a source, a target, a
+        source folder or any other link of a tracked file. Returns the
+        matching (source, target) records.
+        """
+        path = os.path.abspath(path)
+        if path in self.by_source:
+            return [(path, self.by_source[path])]
+        if path in self.by_target:
+            return [(self.by_target[path], path)]
+        if os.path.isdir(path):
+            return self.under(path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return []
+        return [(self.by_target[target], target) for target in self.by_inode(st.st_dev, st.st_ino)]
+
+def _group_by_dir(paths):
+    dirs = defaultdict(list)
+    for path in paths:
+        dir_path, name = os.path.split(path)
+        dirs[dir_path].append(name)
+    return dirs
+
+def _list_inodes(dir_path):
+    """
+    {name: inode} for the files in a folder and its st_dev, from a single
+    scandir. A missing folder is empty.
+    """
+    try:
+        dev = os.stat(dir_path).st_dev
+        with os.scandir(dir_path) as it:
+            return {entry.name: entry.inode() for entry in it}, dev
+    except (FileNotFoundError, NotADirectoryError):
+        return {}, None
+
+class PruneRefused(Exception):
+    """
+    Raised instead of pruning when the sources look unavailable (an
+    unmounted disk or export) rather than deleted.
+    """
+
+def find_orphans(tracking):
+    """
+    Go through every record and sort out the ones that are no longer
+    right. Returns (orphans, stale):
+    - orphans: (source, target) records whose target is still in the media
+      folder but is the only link left of its file (link count 1), i.e.
+      the source was deleted or replaced by another file. A copy made by
+      the link fallback always has a link count of 1, it is only an orphan
+      when the source is gone or no longer the same (link_methods.is_copy_of).
+    - stale: (source, target) records whose target is gone already.
+
+    A target whose source path is missing but which still has other links
+    is kept: the download client moved the torrent, it is still seeding.
+
+    Sources and targets are checked one folder at a time: a scandir gives
+    the inode of every file in it, so a target is only stat'ed (for its
+    link count) when its source is missing or is a different file.
+    """
+    records = dict(tracking.items())
+    source_dirs = _group_by_dir(records)
+    target_inodes = {}
+
+    orphans, stale = [], []
+    for source_dir, names in source_dirs.items():
+        source_listing, _ = _list_inodes(source_dir)
+        for name in names:
+            source_path = os.path.join(source_dir, name)
+            target_path = records[source_path]
+            target_dir, target_name = os.path.split(target_path)
+            if target_dir not in target_inodes:
+                target_inodes[target_dir] = _list_inodes(target_dir)[0]
+
+            target_ino = target_inodes[target_dir].get(target_name)
+            source_ino = source_listing.get(name)
+            if target_ino is None:
+                stale.append((source_path, target_path))
+            elif source_ino == target_ino:
+                continue
+            elif os.lstat(target_path).st_nlink > 1:
+                continue
+            elif source_ino is None or not is_copy_of(source_path, target_path):
+                orphans.append((source_path, target_path))
+    return orphans, stale
+
+def check_sources(tracking, source_root=None, source_dev=None, check_folders=True):
+    """
+    Make sure the sources of a tracking store are there to be checked at
+    all, raising PruneRefused otherwise: the source root has to exist, be
+    on source_dev (when given, e.g. the device of the media folder for a
+    hardlink only library) and, with check_folders, most of the top level
+    folders under it that have records have to exist (see
+    MAX_MISSING_FOLDERS). An unmounted export or an empty mount point looks
+    like all of its files were deleted, and this is what tells them apart
+    from a download client removing some torrents.
+    Without a source root the folder all sources have in common is used.
+    """
+    if source_root is None:
+        source_dirs = {os.path.dirname(source_path) for source_path, _ in tracking.items()}
+        if not source_dirs:
+            return
+        source_root = os.path.commonpath(sorted(source_dirs))
+    source_root = os.path.abspath(source_root)
+    try:
+        st = os.stat(source_root)
+    except FileNotFoundError:
+        raise PruneRefused(f"The source folder {source_root} is missing, is it mounted?")
+    if source_dev is not None and st.st_dev != source_dev:
+        raise PruneRefused(f"The source folder {source_root} is on another device than expected, is it mounted?")
+    if not check_folders:
+        return
+
+    prefix = os.path.join(source_root, '')
+    top_level = set()
+    for source_path, _ in tracking.items():
+        if source_path.startswith(prefix):
+            relative_path = source_path[len(prefix):]
+            if os.sep in relative_path:
+                top_level.add(relative_path.split(os.sep, 1)[0])
+    missing = sorted(name for name in top_level if not os.path.isdir(os.path.join(source_root, name)))
+    if missing and len(missing) > MAX_MISSING_FOLDERS * len(top_level):
+        shown = ', '.join(missing[:5]) + (f" and {len(missing) - 5} more" if len(missing) > 5 else '')
+        raise PruneRefused(f"{len(missing)} of {len(top_level)} source folders are missing from {source_root}: "
+                           f"{shown}. Use --force if they were deleted on purpose")
+
+def prune_links(tracking, dry_run=False, stop_at=None, source_root=None, source_dev=None, force=False):
+    """
+    Delete orphaned media files, drop their records and the records of
+    targets that are gone, and remove the media folders that end up empty
+    (up to, not including, stop_at). Returns (orphans, stale, errors).
+
+    The sources are checked first and PruneRefused is raised if they look
+    unavailable (see check_sources). force skips the check of the top level
+    folders, never the one of the source root itself.
+    """
+    check_sources(tracking, source_root, source_dev, check_folders=not force)
+
+    orphans, stale = find_orphans(tracking)
+    errors = []
+    if dry_run:
+        return orphans, stale, errors
+
+    emptied = set()
+    for source_path, target_path in orphans:
+        try:
+            os.unlink(target_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            errors.append((target_path, str(e)))
+            continue
+        tracking.remove(source_path)
+        emptied.add(os.path.dirname(target_path))
+    for source_path, _ in stale:
+        tracking.remove(source_path)
+    tracking.flush()
+
+    stop_at = os.path.join(os.path.abspath(stop_at), '') if stop_at is not None else None
+    # Deepest first, so a season folder goes before its show folder
+    for dir_path in sorted(emptied, key=len, reverse=True):
+        while dir_path != os.path.dirname(dir_path) and (stop_at is None or dir_path.startswith(stop_at)):
+            try:
+                os.rmdir(dir_path)
+            except OSError:
+                break
+            dir_path = os.path.dirname(dir_path)
+    return orphans, stale, errors
+
+def print_prune_results(orphans, stale, errors, dry_run=False):
+    for source_path, target_path in orphans:
+        print(f"{'Would remove' if dry_run else 'Removed'}: {target_path} (was {source_path})")
+    for target_path, error in errors:
+        print(f"Error removing {target_path}: {error}")
+    print(f"Orphaned links: {len(orphans)} | Records of missing targets: {len(stale)} | Errors: {len(errors)}")
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Query a tracking file or prune the links whose source is gone.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    query_parser = subparsers.add_parser("query", help="show the records for a source, target, folder or any link of a file")
+    query_parser.add_argument("tracking_file")
+    query_parser.add_argument("paths", nargs="+")
+    prune_parser = subparsers.add_parser("prune", help="delete media files whose source is gone")
+    prune_parser.add_argument("tracking_file")
+    prune_parser.add_argument("--target-root", metavar="DIR", help="never remove this folder or anything above it")
+    prune_parser.add_argument("--source-root", metavar="DIR",
+                              help="refuse to prune when this folder, or most of the folders in it, are missing "
+                                   "(default: the folder all sources are in)")
+    prune_parser.add_argument("--force", action="store_true", help="prune even when most source folders are missing")
+    prune_parser.add_argument("--dry-run", action="store_true", help="only list what would be removed")
+    args = parser.parse_args()
+
+    with TrackingStore(args.tracking_file) as tracking:
+        if args.command == "query":
+            index = TrackingIndex(tracking)
+            for path in args.paths:
+                records = index.lookup(path)
+                if not records:
+                    print(f"Not tracked: {path}")
+                for source_path, target_path in records:
+                    print(f"{source_path} -> {target_path}")
+        else:
+            try:
+                results = prune_links(tracking, args.dry_run, args.target_root, args.source_root, force=args.force)
+            except PruneRefused as e:
+                print(f"Not pruning: {e}")
+                raise SystemExit(1)
+            print_prune_results(*results, dry_run=args.dry_run)
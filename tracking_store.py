@@ -0,0 +1,292 @@
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from itertools import islice
+from json.decoder import scanstring
+from json.encoder import encode_basestring_ascii
+
+from atomic_file import atomic_open
+
+try:
+    import fcntl
+except ImportError:
+    # Not on Windows, appends and compactions are then not locked
+    fcntl = None
+
+class TrackingStore:
+    """
+    Keep track of which files have been hardlinked, without rewriting the
+    whole tracking JSON for every link.
+
+    New source -> target records are buffered and appended in batches to a
+    JSONL journal next to the JSON file (hardlinked_*.json), and the
+    journal is folded back into the JSON file (compaction) when it grows
+    large or the store is closed.
+
+    Both are crash safe: every batch is fsynced before flush() returns, and
+    the JSON file is replaced atomically, so a run that dies half way
+    leaves either the old or the new file behind, never a truncated one.
+
+    A run only ever appends, so the JSON file is not loaded at all: the
+    compaction streams it through, record by record, and only the journal
+    (at most compact_every records) is held in memory. Memory stays the
+    same whether the library has ten thousand files or ten million. The
+    lookups (get, in, len) load everything on first use.
+
+    remove() writes a journal record with a null target, which drops the
+    source at the next compaction.
+
+    Other processes (link_one from the download client hooks, the watch
+    daemon) use the same journal. Appends and the whole of a compaction
+    take an flock on a .lock file next to the JSON file, so an append waits
+    for a compaction and two compactions never overlap. The compaction
+    renames the journal to .jsonl.compacting first and only deletes that
+    once the JSON file is written. With compact_every None the store never
+    compacts by itself.
+    """
+
+    def __init__(self, tracking_file, batch_size=1000, flush_interval=5.0, compact_every=100000):
+        self.tracking_file = Path(tracking_file)
+        self.journal_file = self.tracking_file.with_suffix('.jsonl')
+        self.compacting_file = self.tracking_file.with_suffix('.jsonl.compacting')
+        self.lock_file = self.tracking_file.with_suffix('.lock')
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+
+        # add() may be called from the link worker threads
+        self.lock = threading.RLock()
+        # Every record, only filled in by load() for the lookups
+        self.data = None
+        self.pending = []
+        # How deep this store is in journal_lock(), flock is only taken once
+        self.lock_depth = 0
+        self.last_flush = time.monotonic()
+        # Left behind by a previous run that did not get to compact
+        self.journal_records = _count_lines(self.compacting_file) + _count_lines(self.journal_file)
+
+    def load(self):
+        """
+        Read every record into memory for get(), `in` and len().
+        """
+        with self.lock:
+            self.data = dict(self.items())
+        return self
+
+    def read_journal(self):
+        """
+        The records in the journal, as a dict. Removed sources map to None.
+        A journal that is being compacted is older, the current one is
+        applied on top of it.
+        """
+        records = {}
+        for journal_file in (self.compacting_file, self.journal_file):
+            try:
+                f = open(journal_file, 'r')
+            except FileNotFoundError:
+                continue
+            with f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A run that died mid-write can leave a partial last line
+                        continue
+                    records[record['source']] = record['target']
+        return records
+
+    def items(self):
+        """
+        Yield every (source, target) record: the JSON file streamed from
+        disk, with the journal applied on top.
+        """
+        with self.lock:
+            self.flush()
+            journal = self.read_journal()
+            if self.tracking_file.exists():
+                for source_path, target_path in _read_records(self.tracking_file):
+                    if source_path not in journal:
+                        yield source_path, target_path
+            for source_path, target_path in journal.items():
+                if target_path is not None:
+                    yield source_path, target_path
+
+    def add(self, source_path, target_path):
+        """
+        Record a new hardlink. The record is written out with the next batch.
+        """
+        source_path, target_path = str(source_path), str(target_path)
+        with self.lock:
+            if self.data is not None:
+                self.data[source_path] = target_path
+            self.pending.append((source_path, target_path))
+
+            if len(self.pending) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+
+    def remove(self, source_path):
+        """
+        Forget the hardlink of a source, e.g. because it was pruned.
+        """
+        source_path = str(source_path)
+        with self.lock:
+            if self.data is not None:
+                self.data.pop(source_path, None)
+            self.pending.append((source_path, None))
+
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Append the buffered records to the journal in one write.
+        """
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if not self.pending:
+                return
+
+            lines = [json.dumps({'source': s, 'target': t}) + '\n' for s, t in self.pending]
+            with self.journal_lock(), open(self.journal_file, 'a+b') as f:
+                # A crash mid-write can leave a partial last line, end it so
+                # the new records are not glued onto it
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        lines.insert(0, '\n')
+                f.write(''.join(lines).encode())
+                f.flush()
+                os.fsync(f.fileno())
+            self.journal_records += len(self.pending)
+            self.pending = []
+
+            if self.compact_every is not None and self.journal_records >= self.compact_every:
+                self.compact()
+
+    @contextmanager
+    def journal_lock(self):
+        """
+        Hold the lock of the journal, shared by every process that uses
+        this tracking file. Called with self.lock held, and can be nested.
+        """
+        if fcntl is None or self.lock_depth:
+            self.lock_depth += 1
+            try:
+                yield
+            finally:
+                self.lock_depth -= 1
+            return
+        with open(self.lock_file, 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            self.lock_depth += 1
+            try:
+                yield
+            finally:
+                self.lock_depth -= 1
+
+    def compact(self):
+        """
+        Write all records back to the JSON file and drop the journal.
+        """
+        with self.lock, self.journal_lock():
+            # One left behind by a compaction that died is folded first,
+            # the current journal stays and is applied on top
+            if not self.compacting_file.exists() and self.journal_file.exists():
+                os.replace(self.journal_file, self.compacting_file)
+            self.export_json(self.tracking_file)
+            if self.compacting_file.exists():
+                self.compacting_file.unlink()
+            self.journal_records = _count_lines(self.journal_file)
+
+    def close(self):
+        self.flush()
+        if self.journal_records or not self.tracking_file.exists():
+            self.compact()
+
+    def import_json(self, json_file):
+        """
+        Merge records from a tracking file in the old JSON format.
+        """
+        for source_path, target_path in _read_records(json_file):
+            self.add(source_path, target_path)
+
+    def export_json(self, json_file):
+        """
+        Write all records to a file in the old JSON format, the same as
+        json.dump(records, f, indent=2) but one record at a time.
+        """
+        with self.lock:
+            # Reading the old file while its replacement is written is fine,
+            # the new one is only renamed over it at the end
+            records = self.items()
+            with atomic_open(json_file) as f:
+                first = next(records, None)
+                if first is None:
+                    f.write('{}')
+                    return
+                f.write(f'{{\n  {encode_basestring_ascii(first[0])}: {encode_basestring_ascii(first[1])}')
+                for source_path, target_path in records:
+                    f.write(f',\n  {encode_basestring_ascii(source_path)}: {encode_basestring_ascii(target_path)}')
+                f.write('\n}')
+
+    def get(self, source_path, default=None):
+        if self.data is None:
+            self.load()
+        return self.data.get(str(source_path), default)
+
+    def __contains__(self, source_path):
+        if self.data is None:
+            self.load()
+        return str(source_path) in self.data
+
+    def __len__(self):
+        if self.data is None:
+            self.load()
+        return len(self.data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def _count_lines(path):
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return 0
+    with f:
+        return sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+
+def _read_records(json_file):
+    """
+    Yield the (source, target) records of a tracking file in the JSON
+    format. Files written by export_json (and json.dump with an indent)
+    have one record per line and are read line by line, so the whole dict
+    is never built. Anything else falls back to json.load.
+    """
+    read = 0
+    with open(json_file, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line in ('{', '}', '{}', ''):
+                continue
+            try:
+                if line[0] != '"':
+                    raise ValueError(line)
+                source_path, end = scanstring(line, 1)
+                target_path, end = scanstring(line, line.index('"', end) + 1)
+            except ValueError:
+                break
+            if line[end:] not in ('', ','):
+                break
+            read += 1
+            yield source_path, target_path
+        else:
+            return
+    # Not one record per line, e.g. written without an indent
+    with open(json_file, 'r') as f:
+        yield from islice(json.load(f).items(), read, None)
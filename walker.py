@@ -0,0 +1,101 @@
+import os
+import time
+
+from scan_index import file_signature
+
+def scan_tree(root, scan_index=None, resume_after=None, on_listed=None):
+    """
+    Walk the tree under root with os.scandir and lazily yield
+    (relative_dir, entry) for every file, where relative_dir is the folder
+    relative to root ('' for root itself) and entry is the os.DirEntry.
+
+    File types come from the cached DirEntry data, so no stat call is made
+    per file. With a scan index (incremental mode) directories whose mtime
+    and inode did not change are not listed again, and only new or resized
+    files are yielded.
+
+    Folders are visited depth first in name order and the files of each
+    folder are yielded together, sorted by name, so the walk order can be
+    checkpointed. With resume_after (the parts of a relative folder, as
+    saved by a Checkpoint) every folder up to and including that one is
+    skipped; folders that sort before it are not even listed.
+
+    on_listed(dir_path, start, seconds) is called for every folder the walk
+    looked at, with how long its listing (or its index lookup) took, start
+    being a perf_counter time.
+    """
+    root = str(root)
+    resume_after = tuple(resume_after) if resume_after is not None else None
+    # (absolute dir, relative dir, stat result or None)
+    stack = [(root, '', None)]
+    while stack:
+        dir_path, rel_dir, st = stack.pop()
+
+        done = False
+        if resume_after is not None:
+            parts = tuple(rel_dir.split(os.sep)) if rel_dir else ()
+            if parts > resume_after:
+                resume_after = None
+            elif resume_after[:len(parts)] != parts:
+                # Sorts before the checkpoint and is not on the way to it
+                continue
+            else:
+                # On the way to the checkpoint, only look for subfolders
+                done = True
+
+        if on_listed is not None:
+            start = time.perf_counter()
+        old_files = None
+        if scan_index is not None:
+            try:
+                if st is None:
+                    st = os.stat(dir_path)
+            except FileNotFoundError:
+                continue
+            scan_index.mark_seen(dir_path)
+
+            saved = scan_index.lookup(dir_path, st)
+            if saved is not None:
+                # Unchanged directory, just visit the subdirectories we know about
+                for name in sorted(saved['dirs'], reverse=True):
+                    stack.append((os.path.join(dir_path, name), os.path.join(rel_dir, name), None))
+                if on_listed is not None:
+                    on_listed(dir_path, start, time.perf_counter() - start)
+                continue
+
+            old_files = scan_index.old_files(dir_path, st)
+
+        subdirs = []
+        entries = []
+        files = []
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry)
+                    elif entry.is_file():
+                        if old_files is None:
+                            entries.append(entry)
+                            continue
+                        signature = file_signature(entry.name, entry.stat().st_size)
+                        files.append(signature)
+                        if signature not in old_files:
+                            entries.append(entry)
+        except FileNotFoundError:
+            # Removed while we were walking (e.g. a finished torrent being moved)
+            continue
+
+        if scan_index is not None:
+            scan_index.update(dir_path, st, [d.name for d in subdirs], files)
+
+        subdirs.sort(key=lambda entry: entry.name, reverse=True)
+        for entry in subdirs:
+            sub_st = entry.stat(follow_symlinks=False) if scan_index is not None else None
+            stack.append((entry.path, os.path.join(rel_dir, entry.name), sub_st))
+        if on_listed is not None:
+            on_listed(dir_path, start, time.perf_counter() - start)
+
+        if not done:
+            entries.sort(key=lambda entry: entry.name)
+            for entry in entries:
+                yield rel_dir, entry
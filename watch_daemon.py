@@ -0,0 +1,371 @@
+import os
+import time
+import errno
+import select
+import signal
+import struct
+import ctypes
+import ctypes.util
+import argparse
+from pathlib import Path
+
+from tracking_store import TrackingStore
+from name_classifier import DEFAULT_MATCHER
+from naming_rules import load_rules
+from parse_cache import ParseCache
+from walker import scan_tree
+from link_planner import plan_folder, resolve_collisions, merge_collisions, sort_plan, execute_plan
+from inode_index import InodeIndex, check_plan
+from link_methods import LinkChain, is_copy_of
+from show_layout import LAYOUTS, SeasonLayout
+
+# From <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct('iIII')
+
+class Inotify:
+    """
+    Minimal inotify binding through ctypes, no third party package needed.
+    """
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        # watch descriptor -> directory
+        self.watches = {}
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), str(path))
+        self.watches[wd] = str(path)
+        return wd
+
+    def read_events(self):
+        """
+        Return the pending events as (wd, mask, cookie, name) tuples.
+        """
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class Library:
+    """
+    One watched source -> target pair, with its state kept warm between
+    events: tracking store, inode index of the target tree and parse cache.
+    rules is the NameMatcher to rename shows with, the default naming rules
+    without one. layout is 'mirror' or, for shows, 'season', the same as
+    for a full run. link makes one link, e.g. a link_methods.LinkChain for
+    a media folder on another filesystem.
+    """
+
+    def __init__(self, kind, source, target, tracking_file, parse_cache_file=None, rules=None, layout='mirror',
+                 link=os.link):
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown layout {layout!r}, expected one of {', '.join(LAYOUTS)}")
+        if layout == 'season' and kind != 'shows':
+            raise ValueError(f"The season layout is only for shows, not {kind}")
+        self.kind = kind
+        self.source = Path(source).resolve()
+        self.target = Path(target).resolve()
+        self.rules = rules or DEFAULT_MATCHER
+        self.make_link = link
+        self.tracking = TrackingStore(tracking_file)
+        self.parse_cache = ParseCache(parse_cache_file, matcher=self.rules) if parse_cache_file is not None else None
+        self.inode_index = InodeIndex().scan(self.target)
+        self.source_dev = os.stat(self.source).st_dev
+        self.root_in_featurettes = self.rules.keeps_names(self.source.parts)
+        # Kept between events, like the folders a full run has seen
+        self.layout = SeasonLayout(self.target) if layout == 'season' else None
+
+    def plan(self, source_files):
+        """
+        Plan the links for a batch of files, folder by folder the way a
+        full run would. Returns the plan and the collisions in it.
+        """
+        classify = None
+        if self.kind == 'shows':
+            classify = self.parse_cache.classify if self.parse_cache is not None else self.rules.classify
+        by_dir = {}
+        for source_file in source_files:
+            dir_path, name = os.path.split(source_file)
+            by_dir.setdefault(dir_path, set()).add(name)
+
+        plan = []
+        collisions = {}
+        planned = {} if self.layout is not None else None
+        target_root = str(self.target)
+        for dir_path in sorted(by_dir):
+            names = by_dir[dir_path]
+            try:
+                with os.scandir(dir_path) as it:
+                    entries = sorted((entry for entry in it if entry.name in names and entry.is_file()),
+                                     key=lambda entry: entry.name)
+            except FileNotFoundError:
+                continue
+            relative_dir = os.path.relpath(dir_path, self.source)
+            if relative_dir == os.curdir:
+                relative_dir = ''
+            is_in_featurettes = self.root_in_featurettes or self.rules.keeps_names(relative_dir.split(os.sep))
+            if self.layout is not None and not self.root_in_featurettes:
+                # The folders above decide where non-episode files go
+                self.layout.prime(self.source, relative_dir, self.rules, classify=classify)
+            items, found = resolve_collisions(plan_folder(relative_dir, entries, target_root, classify,
+                                                          self.layout, is_in_featurettes), planned)
+            merge_collisions(collisions, found)
+            plan.extend(items)
+        return plan, collisions
+
+    def link(self, source_files):
+        """
+        Plan, check against the warm inode index and link a batch of files.
+        """
+        plan, collisions = self.plan(source_files)
+        plan, already_linked, mismatched = check_plan(sort_plan(plan), self.inode_index, self.source_dev)
+
+        for target, sources in collisions.items():
+            print(f"Collision: {', '.join(sources)} all map to {target}, only linking {sources[0]}")
+        for item, existing in mismatched:
+            print(f"Mismatch: {existing} is not a link of {item.source}")
+
+        # source -> the method a LinkChain used, None for os.link
+        linked = {}
+        def link_and_count(source_path, target_path):
+            linked[source_path] = self.make_link(source_path, target_path)
+
+        errors = execute_plan(plan, self.tracking, link=link_and_count)
+        failed = {source for source, _ in errors}
+        for source, error in errors:
+            print(f"Error processing {source}: {error}")
+        for item in plan:
+            if item.source in linked:
+                method = linked[item.source]
+                if method in (None, 'hardlink'):
+                    self.inode_index.add((self.source_dev, item.inode), item.target)
+                    print(f"Linked: {item.source} -> {item.target}")
+                else:
+                    # A reflink or copy is a file of its own
+                    st = os.stat(item.target, follow_symlinks=False)
+                    self.inode_index.add((st.st_dev, st.st_ino), item.target)
+                    print(f"Linked ({method}): {item.source} -> {item.target}")
+            elif item.source not in failed:
+                # The target appeared since the index was built, index what is really there
+                try:
+                    st = os.stat(item.target, follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                self.inode_index.add((st.st_dev, st.st_ino), item.target)
+                if (st.st_dev, st.st_ino) != (self.source_dev, item.inode) and not is_copy_of(item.source, item.target):
+                    print(f"Mismatch: {item.target} is not a link of {item.source}")
+
+        self.tracking.flush()
+        return len(linked)
+
+    def close(self):
+        self.tracking.close()
+        if self.parse_cache is not None:
+            self.parse_cache.save()
+
+class WatchDaemon:
+    """
+    Watch the download folders with inotify and link new files once they
+    have been quiet for `settle` seconds, instead of rescanning from cron.
+    """
+
+    def __init__(self, libraries, settle=5.0):
+        self.libraries = libraries
+        self.settle = settle
+        self.inotify = Inotify()
+        # file path -> time of its last event
+        self.pending = {}
+        self.running = False
+
+    def library_for(self, path):
+        for library in self.libraries:
+            if path == str(library.source) or path.startswith(str(library.source) + os.sep):
+                return library
+        return None
+
+    def watch_tree(self, root):
+        """
+        Watch root and every folder below it. Returns the files already in
+        there, which may have been written before the watch existed.
+        """
+        existing = []
+        stack = [str(root)]
+        while stack:
+            dir_path = stack.pop()
+            try:
+                self.inotify.add_watch(dir_path)
+                with os.scandir(dir_path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            existing.append(entry.path)
+            except OSError as e:
+                if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                    print(f"Cannot watch {dir_path}: {e}")
+        return existing
+
+    def queue(self, path, now):
+        # In-progress downloads (.<hash>.parts) are renamed when they finish,
+        # which arrives as an IN_MOVED_TO for the final name
+        library = self.library_for(path)
+        rules = library.rules if library is not None else DEFAULT_MATCHER
+        if rules.classify(os.path.basename(path)).kind == 'temp':
+            return
+        self.pending[path] = now
+
+    def handle_event(self, wd, mask, name, now):
+        if mask & IN_Q_OVERFLOW:
+            print("Event queue overflowed, rescanning")
+            self.rescan(now)
+            return
+        if mask & IN_IGNORED:
+            self.inotify.watches.pop(wd, None)
+            return
+
+        dir_path = self.inotify.watches.get(wd)
+        if dir_path is None or not name:
+            return
+        path = os.path.join(dir_path, name)
+
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                # A new folder (e.g. a finished torrent moved in), watch it
+                # and pick up whatever is already inside
+                for file_path in self.watch_tree(path):
+                    self.queue(file_path, now)
+        elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+            self.queue(path, now)
+
+    def rescan(self, now):
+        for library in self.libraries:
+            for _, entry in scan_tree(library.source):
+                self.queue(entry.path, now)
+
+    def process_settled(self, now):
+        settled = [path for path, last_event in self.pending.items() if now - last_event >= self.settle]
+        if not settled:
+            return
+        for path in settled:
+            del self.pending[path]
+
+        by_library = {}
+        for path in settled:
+            library = self.library_for(path)
+            if library is not None:
+                by_library.setdefault(library, []).append(path)
+        for library, paths in by_library.items():
+            library.link(paths)
+
+    def stop(self, *_):
+        self.running = False
+
+    def run(self, initial_sync=True):
+        now = time.monotonic()
+        for library in self.libraries:
+            existing = self.watch_tree(library.source)
+            print(f"Watching {library.source} ({len(existing)} files)")
+            if initial_sync:
+                # Already linked files are cheap to skip thanks to the inode index
+                library.link(existing)
+
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.running = True
+        try:
+            while self.running:
+                if self.pending:
+                    next_due = min(self.pending.values()) + self.settle
+                    timeout = max(0.0, min(next_due - time.monotonic(), 1.0))
+                else:
+                    timeout = 1.0
+                try:
+                    ready, _, _ = select.select([self.inotify.fd], [], [], timeout)
+                except InterruptedError:
+                    continue
+
+                now = time.monotonic()
+                if ready:
+                    for wd, mask, _, name in self.inotify.read_events():
+                        self.handle_event(wd, mask, name, now)
+                self.process_settled(now)
+        finally:
+            for library in self.libraries:
+                library.close()
+            self.inotify.close()
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Watch the download folders and hardlink new files as they finish.")
+    parser.add_argument("--settle", type=float, default=5.0, metavar="SECONDS",
+                        help="how long a file must be quiet before it is linked (default: 5)")
+    parser.add_argument("--no-initial-sync", action="store_true",
+                        help="do not link files that are already in the download folders on startup")
+    parser.add_argument("--naming-rules", metavar="FILE",
+                        help="rename shows with the rules in FILE instead of naming_rules.json")
+    parser.add_argument("--layout", choices=LAYOUTS, default="mirror",
+                        help="mirror the download folders (default) or sort episodes into Show (Year)/Season NN/")
+    parser.add_argument("--link-methods", default="hardlink", metavar="LIST",
+                        help="comma separated fallback chain of hardlink, reflink and copy, for a media folder "
+                             "on another filesystem (default: hardlink)")
+    parser.add_argument("--copy-workers", type=int, default=2, metavar="N",
+                        help="run at most N copies at once (default: 2)")
+    parser.add_argument("--bwlimit", type=float, metavar="MB/S", help="limit the combined copy bandwidth")
+    args = parser.parse_args()
+    link_methods = args.link_methods.split(",")
+    link = os.link
+    if link_methods != ["hardlink"]:
+        # One chain for both libraries, the copy limits are shared
+        link = LinkChain(link_methods, args.copy_workers, args.bwlimit * 1000000 if args.bwlimit else None)
+    rules = load_rules(args.naming_rules) if args.naming_rules is not None else None
+
+    current_dir = Path.cwd()
+    hardlinks_dir = current_dir / "hardlinks"
+    hardlinks_dir.mkdir(exist_ok=True)
+
+    libraries = []
+    for kind in ("shows", "movies"):
+        source_directory = current_dir / "downloads" / kind
+        if not source_directory.is_dir():
+            print(f"Not watching {source_directory}, it does not exist")
+            continue
+        parse_cache_file = hardlinks_dir / "parse_cache_shows.json" if kind == "shows" else None
+        libraries.append(Library(kind, source_directory, current_dir / "media" / kind,
+                                 hardlinks_dir / f"hardlinked_{kind}.json", parse_cache_file,
+                                 rules if kind == "shows" else None, args.layout if kind == "shows" else "mirror",
+                                 link))
+
+    WatchDaemon(libraries, settle=args.settle).run(initial_sync=not args.no_initial_sync)